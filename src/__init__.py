@@ -2,4 +2,6 @@ STEM_PAT = r"[\w'\$]+\+[A-Z]+"
 # combo of letters, apostr, stress marker
 # +ABRV tag for part of speech
 
+from .analysis import Analysis
 from .parser import Parser, BASIC_E, BASIC_EW, FULL_E, FULL_EW
+from .async_parser import AsyncParser
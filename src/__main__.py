@@ -0,0 +1,283 @@
+import argparse
+import fileinput
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .builder import FomaBuilder
+from .parser import Parser, FULL_EW, proj_root
+from .runner import TASKS, run_corpus
+
+"""
+Command line entry point for the package. Usage:
+    python -m src build --all
+    python -m src build fst/basic_east.json fst/full_east.json -j 2
+    python -m src analyze < words.txt > analyses.jsonl
+    python -m src lemmatize -c fst/basic_east.json -j 4 --format tsv words.txt
+    python -m src corpus -t analyze,ilg words.txt > glossed.jsonl
+"""
+
+
+def build_config(config: dict) -> dict:
+    """
+    Builds (or loads, if up to date) the parser for one configuration
+    dictionary. Returns its name, build time in seconds, and the
+    state/arc/path counts recorded in its build manifest.
+    """
+    start = time.perf_counter()
+    Parser(config)
+    seconds = time.perf_counter() - start
+
+    manifest = FomaBuilder(config).read_manifest() or {}
+    return {
+        "name": config["name"],
+        "seconds": seconds,
+        "states": manifest.get("states"),
+        "arcs": manifest.get("arcs"),
+        "paths": manifest.get("paths"),
+    }
+
+
+def build_all(configs: list, workers: int = None):
+    """
+    Builds each configuration dictionary in a process pool, yielding
+    (config, result) pairs as builds finish; result is the output of
+    build_config, or the exception that stopped the build.
+    Configs which would write the same not-yet-cached compiled rule
+    definitions are held back until the first of them has been built,
+    so that they load the cache rather than all writing it at once.
+    """
+    first, rest = schedule(configs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in (first, rest):
+            futures = {pool.submit(build_config, config): config for config in batch}
+            for future in as_completed(futures):
+                error = future.exception()
+                yield futures[future], error if error else future.result()
+
+
+def schedule(configs: list) -> tuple:
+    """
+    Splits configs into two batches to build one after the other: the
+    first holds one config for each missing rule definitions cache
+    plus every config whose cache exists (or that has none); the
+    second holds the remaining configs sharing a cache being built.
+    """
+    first, rest = [], []
+    pending = set()
+    for config in configs:
+        cache = FomaBuilder(config).definitions_filepath()
+        if cache and not os.path.exists(cache) and cache in pending:
+            rest.append(config)
+        else:
+            pending.add(cache)
+            first.append(config)
+    return first, rest
+
+
+def load_config(config_file: str, output_dir: str = None) -> dict:
+    """
+    Reads a configuration file. With output_dir, the config's files
+    are built in their own subdirectory output_dir/name, while the
+    rule definitions cache is kept in output_dir itself, shared by
+    all the configs built there.
+    """
+    with open(config_file) as f:
+        config = json.load(f)
+    if output_dir:
+        output_dir = os.path.abspath(output_dir)
+        config["output_dir"] = os.path.join(output_dir, config["name"])
+        config["definitions_dir"] = output_dir
+    return config
+
+
+def build_command(args: argparse.Namespace) -> int:
+    """
+    Runs the build subcommand and prints one line per config.
+    Returns the exit status: 1 if any build failed.
+    """
+    config_files = list(args.configs)
+    if args.all:
+        config_files += sorted(glob.glob(os.path.join(proj_root, "fst", "*.json")))
+    if not config_files:
+        print("No configuration files given (use --all to build all)", file=sys.stderr)
+        return 2
+
+    configs = [load_config(file, args.output_dir) for file in config_files]
+
+    status = 0
+    start = time.perf_counter()
+    for config, result in build_all(configs, args.workers):
+        if isinstance(result, Exception):
+            print("{}: failed: {}".format(config["name"], result), file=sys.stderr)
+            status = 1
+            continue
+        print(
+            "{name}: {seconds:.1f}s, {states} states, "
+            "{arcs} arcs, {paths} paths".format(**result)
+        )
+    seconds = time.perf_counter() - start
+    print("finished {} builds in {:.1f}s".format(len(configs), seconds))
+    return status
+
+
+def lookup_lines(
+    lines,
+    command: str,
+    load_input: str = FULL_EW,
+    batch_size: int = 1000,
+    workers: int = 1,
+    cache_size: int = None,
+):
+    """
+    Looks up each line of an iterable of lines (such as an open file)
+    as one query with the given command (analyze, generate, lemmatize),
+    in batches of batch_size lines, with the corpus runner.
+    Yields a (query, results) pair per line, in input order.
+    """
+    rows = run_corpus(lines, load_input, (command,), batch_size, workers, cache_size)
+    for row in rows:
+        yield row["input"], row[command]
+
+
+def format_result(query: str, results: list, output_format: str) -> str:
+    """
+    Returns one output line for a query and its results: a JSON
+    object, or for tsv, the query and its results separated by tabs.
+    In tsv, each lemmatize option is given as space-separated
+    form:CAT pairs.
+    """
+    if output_format == "jsonl":
+        return json.dumps({"input": query, "results": results}, ensure_ascii=False)
+    fields = [query]
+    for result in results:
+        if isinstance(result, list):
+            result = " ".join("{}:{}".format(*lemma) for lemma in result)
+        fields.append(result)
+    return "\t".join(fields)
+
+
+def lookup_command(args: argparse.Namespace) -> int:
+    """
+    Runs the analyze, generate or lemmatize subcommand, reading
+    queries one per line from the input files (or stdin) and writing
+    a result line per query to stdout.
+    """
+    lines = fileinput.input(args.inputs, openhook=fileinput.hook_encoded("utf-8"))
+    results = lookup_lines(
+        lines,
+        args.command,
+        args.config,
+        args.batch_size,
+        args.workers,
+        args.cache_size,
+    )
+    for query, result in results:
+        print(format_result(query, result, args.format))
+    return 0
+
+
+def corpus_command(args: argparse.Namespace) -> int:
+    """
+    Runs the corpus subcommand, reading words one per line from the
+    input files (or stdin) and writing a JSON line per word, holding
+    the results of each task.
+    """
+    lines = fileinput.input(args.inputs, openhook=fileinput.hook_encoded("utf-8"))
+    tasks = tuple(args.tasks.split(","))
+    unknown = set(tasks) - set(TASKS + ("generate",))
+    if unknown:
+        print("Unknown tasks: {}".format(", ".join(sorted(unknown))), file=sys.stderr)
+        return 2
+    rows = run_corpus(
+        lines, args.config, tasks, args.batch_size, args.workers, args.cache_size
+    )
+    for row in rows:
+        print(json.dumps(row, ensure_ascii=False))
+    return 0
+
+
+def add_lookup_arguments(command: argparse.ArgumentParser, workers: int) -> None:
+    """
+    Adds the input, parser and batching options shared by the lookup
+    subcommands; workers is the default number of processes.
+    """
+    command.add_argument(
+        "inputs", nargs="*", help="files to read (default: standard input)"
+    )
+    command.add_argument(
+        "-c",
+        "--config",
+        default=FULL_EW,
+        help="config JSON or foma file of the parser (default: full dialectal)",
+    )
+    command.add_argument(
+        "-b", "--batch-size", type=int, default=1000, help="lines per lookup batch"
+    )
+    command.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=workers,
+        help="number of lookup processes (default: %s)" % (workers or "one per CPU"),
+    )
+    command.add_argument(
+        "--cache-size",
+        type=int,
+        default=100000,
+        help="most results kept in memory per process",
+    )
+
+
+def make_arg_parser() -> argparse.ArgumentParser:
+    arg_parser = argparse.ArgumentParser(prog="python -m src")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="build parsers from config files")
+    build.add_argument("configs", nargs="*", help="config JSON files to build")
+    build.add_argument("--all", action="store_true", help="build every config in fst/")
+    build.add_argument("-j", "--workers", type=int, help="number of build processes")
+    build.add_argument(
+        "-o",
+        "--output-dir",
+        help="write each config's files to OUTPUT_DIR/<name> instead of foma/",
+    )
+    build.set_defaults(func=build_command)
+
+    for command, queries in (
+        ("analyze", "surface wordforms"),
+        ("generate", "analyses"),
+        ("lemmatize", "surface wordforms"),
+    ):
+        lookup = commands.add_parser(
+            command, help="{} {}, one per line".format(command, queries)
+        )
+        add_lookup_arguments(lookup, workers=1)
+        lookup.add_argument("--format", choices=("jsonl", "tsv"), default="jsonl")
+        lookup.set_defaults(func=lookup_command)
+
+    corpus = commands.add_parser(
+        "corpus", help="run several lookups over words, one per line, in parallel"
+    )
+    add_lookup_arguments(corpus, workers=None)
+    corpus.add_argument(
+        "-t",
+        "--tasks",
+        default=",".join(TASKS),
+        help="comma-separated tasks to run (default: %(default)s)",
+    )
+    corpus.set_defaults(func=corpus_command)
+
+    return arg_parser
+
+
+def main(argv: list = None) -> int:
+    args = make_arg_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
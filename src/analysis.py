@@ -0,0 +1,77 @@
+import re
+import sys
+
+from . import STEM_PAT
+
+STEM_RE = re.compile(STEM_PAT)
+BOUNDARY_PAT = re.compile(r"([\-=~])")
+
+
+class Analysis:
+    """
+    An analysis output by the FST, parsed into its parts once:
+        raw = the analysis string, e.g. "'nii+PVB-g$at+VI[-3.II]=CN"
+        stems = the stems with their category tags, as lemmatize
+                finds them: ("'nii+PVB", "g$at+VI")
+        pos = the category tag of each stem: ("PVB", "VI")
+        affixes = the other morphemes, attached with - or ~ (with any
+                brackets removed): ("3.II",)
+        clitics = the morphemes attached with =: ("CN",)
+    Tags are interned, so that the many analyses in a cache share one
+    copy of each. An Analysis compares and hashes as its raw string,
+    so it can be used in place of one in lists, sets and dicts.
+    Use parse_analysis to get one.
+    """
+
+    __slots__ = ("raw", "stems", "pos", "affixes", "clitics")
+
+    def __init__(self, raw: str) -> None:
+        self.raw = raw
+        self.stems = tuple(sys.intern(stem) for stem in STEM_RE.findall(raw))
+        self.pos = tuple(sys.intern(stem.rsplit("+", 1)[1]) for stem in self.stems)
+
+        affixes = []
+        clitics = []
+        parts = BOUNDARY_PAT.split(raw.replace("[", "").replace("]", ""))
+        # parts alternate: morpheme, boundary, morpheme, boundary, ...
+        for boundary, morpheme in zip([""] + parts[1::2], parts[::2]):
+            if not morpheme or STEM_RE.search(morpheme):
+                continue
+            if boundary == "=":
+                clitics.append(sys.intern(morpheme))
+            else:
+                affixes.append(sys.intern(morpheme))
+        self.affixes = tuple(affixes)
+        self.clitics = tuple(clitics)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Analysis):
+            return self.raw == other.raw
+        if isinstance(other, str):
+            return self.raw == other
+        return NotImplemented
+
+    def __lt__(self, other) -> bool:
+        if isinstance(other, Analysis):
+            return self.raw < other.raw
+        if isinstance(other, str):
+            return self.raw < other
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.raw)
+
+    def __str__(self) -> str:
+        return self.raw
+
+    def __repr__(self) -> str:
+        return "Analysis({!r})".format(self.raw)
+
+
+def parse_analysis(raw: str) -> Analysis:
+    """
+    Returns the Analysis of an analysis string. The Parser keeps the
+    Analysis objects of cached wordforms, so each is parsed only once
+    while its wordform stays in the cache.
+    """
+    return Analysis(raw)
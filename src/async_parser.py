@@ -0,0 +1,267 @@
+import asyncio
+
+from . import helpers
+from .foma_reader import FomaError, FomaReader
+from .parser import Parser, FULL_EW
+
+
+class AsyncFlookupProcess:
+    """
+    asyncio counterpart of FlookupProcess: a long-lived flookup child
+    for one lookup direction, driven through asyncio streams so that
+    lookups never block the event loop.
+    A lookup that is cancelled part-way leaves unread answers in the
+    child's output, so the child is killed and restarted on next use.
+    The process belongs to the event loop it was started in.
+    """
+
+    def __init__(self, bin_file: str, inverse: bool = False) -> None:
+        self._command = ["flookup", "-b", bin_file]
+        if inverse:
+            self._command.insert(1, "-i")
+        self._process = None
+        self._lock = asyncio.Lock()
+
+    async def lookup(self, query: str) -> str:
+        """
+        Sends a single query to flookup and returns its results as a
+        newline-separated string, in the format of 'flookup -x'.
+        """
+        results = await self.lookup_many([query])
+        return results[0]
+
+    async def lookup_many(self, queries: list) -> list:
+        """
+        Streams a batch of queries through flookup and returns a list
+        of result strings aligned with the input. Queries are written
+        by a separate task while the answers are read back.
+        """
+        # a newline would split a query in two and desync the stream
+        queries = [" ".join(query.splitlines()) for query in queries]
+        if not queries:
+            return []
+
+        async with self._lock:
+            try:
+                return await self._communicate(queries)
+            except (ConnectionError, FomaError):
+                # the child died since the last query; retry once
+                self._kill()
+                return await self._communicate(queries)
+
+    async def close(self) -> None:
+        """
+        Closes the flookup child process and waits for it to exit.
+        """
+        process = self._process
+        self._kill()
+        if process is not None:
+            await process.wait()
+
+    async def _start(self) -> asyncio.subprocess.Process:
+        """
+        Returns the running flookup child, starting one if needed.
+        """
+        if self._process is None or self._process.returncode is not None:
+            self._kill()
+            self._process = await asyncio.create_subprocess_exec(
+                *self._command,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        return self._process
+
+    async def _communicate(self, queries: list) -> list:
+        """
+        Writes a batch of queries to the child process while reading
+        the answers back in order. If anything interrupts the exchange,
+        including cancellation, the child is killed before re-raising.
+        """
+        process = await self._start()
+        writer = asyncio.ensure_future(self._write_queries(process, queries))
+        try:
+            results = [await self._read_result(process, query) for query in queries]
+            await writer
+        except BaseException:
+            writer.cancel()
+            self._kill()
+            raise
+        return results
+
+    @staticmethod
+    async def _write_queries(process, queries: list) -> None:
+        """
+        Writes each query on its own line, pausing whenever the pipe
+        to the child is full.
+        """
+        for query in queries:
+            process.stdin.write((query + "\n").encode("utf-8"))
+            await process.stdin.drain()
+
+    @staticmethod
+    async def _read_result(process, query: str) -> str:
+        """
+        Reads the lines flookup prints for a single query, up to the
+        blank separator line, and strips the echoed query from each.
+        """
+        results = []
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                raise FomaError("flookup exited while reading: {}".format(query))
+            line = line.decode("utf-8").rstrip("\n")
+            if not line:
+                return "\n".join(results)
+            results.append(line[len(query) + 1 :])
+
+    def _kill(self) -> None:
+        """
+        Kills the child process without waiting for it.
+        """
+        process, self._process = self._process, None
+        if process is not None and process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+
+
+class AsyncParser:
+    """
+    Asyncio interface for looking up words with a Parser.
+    Wraps a Parser (or builds one from load_input, as Parser does) and
+    answers analyze/generate lookups through flookup children driven
+    by asyncio, sharing the wrapped parser's result dictionaries: a
+    word looked up through either interface is cached for both.
+    Lookups need the compiled binary file for the parser. The parser
+    is built and loaded in a worker thread on entering the context
+    (or on the first lookup), so that the event loop is not blocked.
+
+        async with AsyncParser(BASIC_E) as fst:
+            await fst.analyze("gat")
+    """
+
+    def __init__(self, load_input: str or dict or Parser = FULL_EW) -> None:
+        if isinstance(load_input, Parser):
+            self.parser = load_input
+        else:
+            self.parser = Parser(load_input)
+        self._binfile = None
+        self._flookups = {}
+        self._warm_reader = None
+
+    async def analyze(self, query: str) -> list:
+        """
+        Input a surface wordform; returns list of possible analyses.
+        """
+        results = await self.analyze_many([query])
+        return results[0]
+
+    async def analyze_many(self, queries: list) -> list:
+        """
+        Input a list of surface wordforms; returns a list of analysis
+        lists aligned with the input. Wordforms not already in the
+        parser's dictionary are looked up together in one pass.
+        """
+        queries = [helpers.convert_to_underscore(query) for query in queries]
+
+        found, misses = self.parser.cached_analyses(queries)
+        results = await self._lookup_many(misses, inverse=False)
+        found.update(self.parser.save_analyses(dict(zip(misses, results))))
+
+        return [[analysis.raw for analysis in found[query]] for query in queries]
+
+    async def generate(self, query: str) -> list:
+        """
+        Input a foma analysis; returns list of possible surface
+        wordforms.
+        """
+        results = await self.generate_many([query])
+        return results[0]
+
+    async def generate_many(self, queries: list) -> list:
+        """
+        Input a list of foma analyses; returns a list of surface
+        wordform lists aligned with the input.
+        """
+        cache = self.parser.generator_dict
+
+        found, misses = cache.get_many(queries)
+        results = await self._lookup_many(misses, inverse=True)
+        results = {
+            query: [helpers.convert_to_macron(item) for item in result_list]
+            for query, result_list in zip(misses, results)
+        }
+        cache.set_many(results)
+        found.update(results)
+
+        return [found[query] for query in queries]
+
+    async def warm(self) -> None:
+        """
+        Builds and loads the wrapped parser, and reads its alphabets,
+        in a worker thread, if this has not been done for the loaded
+        FST yet.
+        """
+        if self.parser.loaded and self.parser._reader is self._warm_reader:
+            return
+        loop = asyncio.get_running_loop()
+        self._warm_reader = await loop.run_in_executor(None, self._load)
+
+    async def close(self) -> None:
+        """
+        Closes the flookup children; they restart on the next lookup.
+        """
+        flookups, self._flookups = self._flookups, {}
+        for flookup in flookups.values():
+            await flookup.close()
+
+    async def __aenter__(self) -> "AsyncParser":
+        await self.warm()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def _lookup_many(self, queries: list, inverse: bool) -> list:
+        """
+        Looks up a batch of queries with the flookup child for the
+        given direction, returning result lists aligned with the input.
+        """
+        await self.warm()
+        reader = self._warm_reader
+        possible = [q for q in queries if not reader.unknown_symbols(q, inverse)]
+        if not possible:
+            return [[] for query in queries]
+        results = await self._flookup(inverse).lookup_many(possible)
+        found = dict(zip(possible, results))
+        return [FomaReader._flookup_as_list(found.get(q, "")) for q in queries]
+
+    def _load(self) -> FomaReader:
+        """
+        Loads the wrapped parser and its alphabets; returns its reader.
+        Blocks, so run it outside the event loop.
+        """
+        self.parser.warm()
+        reader = self.parser._reader
+        reader.load_alphabets()
+        return reader
+
+    def _flookup(self, inverse: bool) -> AsyncFlookupProcess:
+        """
+        Returns the flookup child for the given direction, creating
+        it on first use, or afresh if the parser has been reloaded
+        with a different binary file.
+        """
+        bin_file = self.parser._reader.bin_file
+        if not bin_file:
+            raise FomaError("AsyncParser needs a foma binary file for lookups")
+        if bin_file != self._binfile:
+            for flookup in self._flookups.values():
+                flookup._kill()
+            self._binfile, self._flookups = bin_file, {}
+
+        if inverse not in self._flookups:
+            self._flookups[inverse] = AsyncFlookupProcess(bin_file, inverse)
+        return self._flookups[inverse]
@@ -1,6 +1,12 @@
+import functools
+import hashlib
+import json
 import os
 import re
+import subprocess
+import tempfile
 
+from . import helpers
 from .lexicon import Lexicon
 
 
@@ -8,6 +14,24 @@ class BuilderError(Exception):
     pass
 
 
+# ends every lemmatizer output, so that an analysis without stems still
+# gives an output (an empty one would be lost in the lookup results)
+LEMMATIZER_END = "#"
+
+
+@functools.lru_cache(maxsize=None)
+def foma_version() -> str:
+    """
+    Returns the version string reported by the installed foma,
+    or an empty string if foma cannot be run.
+    """
+    try:
+        result = subprocess.run(["foma", "-v"], capture_output=True, text=True)
+    except OSError:
+        return ""
+    return result.stdout.strip()
+
+
 class FomaBuilder:
     """
     Class to orchestrate building a foma file from a configuration dict.
@@ -27,21 +51,34 @@ class FomaBuilder:
         input dict. Writes both files to dir 'foma/' inside specified
         containing directory as listed in config dictionary.
         If no container dir specified, writes to '../fst/foma'.
+        An "output_dir" in config (relative to the container dir)
+        replaces 'foma/' as the location of all built files, and a
+        "definitions_dir" as that of the rule definitions cache.
         """
-        target_path = os.path.join(self.config["dir"], "foma")
-        if not os.path.exists(target_path):
-            os.mkdir(target_path)
+        os.makedirs(self.output_dir(), exist_ok=True)
+        if self.config.get("definitions_dir"):
+            definitions_dir = os.path.join(
+                self.config["dir"], self.config["definitions_dir"]
+            )
+            os.makedirs(definitions_dir, exist_ok=True)
 
         self._build_lexc()
         self._build_foma()
 
+    def output_dir(self) -> str:
+        """
+        Returns the directory to which built files are written.
+            e.g. configdir/foma
+        """
+        return os.path.join(self.config["dir"], self.config.get("output_dir", "foma"))
+
     def lexc_filepath(self) -> str:
         """
         Generates the path from which to write the main lexc file.
         Based on the configured directory and project name.
             e.g. configdir/foma/projname.txt
         """
-        return os.path.join(self.config["dir"], "foma", self.config["name"] + ".txt")
+        return os.path.join(self.output_dir(), self.config["name"] + ".txt")
 
     def foma_filepath(self) -> str:
         """
@@ -49,7 +86,7 @@ class FomaBuilder:
         Based on the configured directory and project name.
             e.g. configdir/foma/projname.foma
         """
-        return os.path.join(self.config["dir"], "foma", self.config["name"] + ".foma")
+        return os.path.join(self.output_dir(), self.config["name"] + ".foma")
 
     def fomabin_filepath(self) -> str:
         """
@@ -57,10 +94,188 @@ class FomaBuilder:
         Based on the configured directory and project name.
             e.g. configdir/foma/projname.fomabin
         """
+        return os.path.join(self.output_dir(), self.config["name"] + ".fomabin")
+
+    def lemmatizer_filepath(self) -> str:
+        """
+        Generates the path of the binary file of the lemmatizer, the
+        machine built alongside the parser if "lemmatizer" is set in
+        the config, which maps surface forms to their stems.
+            e.g. configdir/foma/projname.lemmatizer.fomabin
+        """
         return os.path.join(
-            self.config["dir"], "foma", self.config["name"] + ".fomabin"
+            self.output_dir(), self.config["name"] + ".lemmatizer.fomabin"
         )
 
+    def manifest_filepath(self) -> str:
+        """
+        Generates the path of the manifest describing the last build.
+        Based on the configured directory and project name.
+            e.g. configdir/foma/projname.manifest.json
+        """
+        return os.path.join(self.output_dir(), self.config["name"] + ".manifest.json")
+
+    def lemmas_filepath(self) -> str:
+        """
+        Generates the path of the stem lemma table of the last build.
+        Based on the configured directory and project name.
+            e.g. configdir/foma/projname.lemmas.json
+        """
+        return os.path.join(self.output_dir(), self.config["name"] + ".lemmas.json")
+
+    def input_hash(self) -> str:
+        """
+        Returns a content hash of everything the compiled machine is
+        built from: the config itself and the dictionary, lexc and
+        rules files it points to.
+        """
+        # dictionary filepaths are resolved in place during the build,
+        # so the dictionary is hashed by content rather than by path
+        config = dict(self.config)
+        dictionaries = config.pop("dictionary", None)
+        if type(dictionaries) is not list:
+            dictionaries = [dictionaries]
+
+        digest = hashlib.sha256()
+        digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+        for dictionary in dictionaries:
+            if type(dictionary) is str:
+                digest.update(self._file_hash(self._dictionary_filepath(dictionary)))
+            else:
+                digest.update(json.dumps(dictionary, sort_keys=True).encode())
+        for file in self.config["lexc_files"] + self.config["rules_files"]:
+            digest.update(self._file_hash(os.path.join(self.config["dir"], file)))
+        return digest.hexdigest()
+
+    def read_manifest(self) -> dict:
+        """
+        Returns the manifest of the last build, or None if there is none.
+        """
+        try:
+            with open(self.manifest_filepath()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_manifest(self, stats: dict) -> None:
+        """
+        Records the input hash, foma version and machine statistics
+        (states/arcs/paths) of a completed build.
+        """
+        manifest = {
+            "hash": self.input_hash(),
+            "foma_version": foma_version(),
+            "foma": self.foma_filepath(),
+            "fomabin": self.fomabin_filepath(),
+        }
+        manifest.update(stats)
+        with open(self.manifest_filepath(), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    def lemma_stems(self) -> list:
+        """
+        Returns the analysis of every stem in the Lexicon as it appears
+        in the FST output, with the tag of its category, as listed
+        in that category's LEXICON in the lexc files:
+            e.g. {"Noun": ["w$an"]} -> ["w$an+N"]
+        Flag diacritics, which analyses do not show, are removed.
+        """
+        tags = self._category_tags()
+        stems = []
+        for category, words in Lexicon(self.config).as_dict().items():
+            for word in words:
+                form = re.sub(r"@[^@]*@", "", Lexicon.lexc_form(word))
+                stems += [form + "+" + tag for tag in tags.get(category, [])]
+        return helpers.unique(stems)
+
+    def read_lemmas(self) -> dict:
+        """
+        Returns the stem lemma table saved for the current inputs, or
+        None if there is none or it was made from other inputs.
+        """
+        try:
+            with open(self.lemmas_filepath()) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get("hash") != self.input_hash():
+            return None
+        return saved["lemmas"]
+
+    def write_lemmas(self, lemmas: dict) -> None:
+        """
+        Saves a table of the surface forms generated for each stem in
+        lemma_stems, with the input hash of the build it was made from.
+        The table is written to a temporary file and then moved into
+        place, so a parser never reads a partly written table.
+        """
+        path = self.lemmas_filepath()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"hash": self.input_hash(), "lemmas": lemmas}, f)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def is_current(self) -> bool:
+        """
+        Checks whether the built foma and binary files are up to date:
+        the manifest hash must match the current inputs, and the foma
+        version must match unless foma is not installed here (so that
+        prebuilt binaries can be loaded without foma). The rule
+        definitions cache the foma file loads must also still exist,
+        since the foma file cannot be compiled without it.
+        """
+        manifest = self.read_manifest()
+        if not manifest or manifest.get("hash") != self.input_hash():
+            return False
+        version = foma_version()
+        if version and manifest.get("foma_version") != version:
+            return False
+        files = [self.foma_filepath(), self.fomabin_filepath()]
+        if self.config.get("lemmatizer"):
+            files.append(self.lemmatizer_filepath())
+        if not all(os.path.exists(file) for file in files):
+            return False
+        with open(self.foma_filepath()) as f:
+            loaded = re.findall(r"^load defined (.+)$", f.read(), re.M)
+        return all(os.path.exists(file) for file in loaded)
+
+    def _dictionary_filepath(self, dictionary: str) -> str:
+        """
+        Resolves a dictionary filepath relative to the configured
+        directory, as the Lexicon does when loading it.
+        """
+        if os.path.exists(dictionary):
+            return dictionary
+        return os.path.join(self.config["dir"], dictionary)
+
+    @staticmethod
+    def _file_hash(path: str) -> bytes:
+        """
+        Returns the sha256 digest of a file's contents.
+        """
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).digest()
+
+    def _category_tags(self) -> dict:
+        """
+        Reads the lexc files for the tags with which each category's
+        LEXICON begins its entries, e.g. {"Noun": ["N"]}.
+        """
+        pattern = r"^LEXICON (\w+)\n(.*?)(?=^LEXICON|\Z)"
+        tags = {}
+        for file in self.config["lexc_files"]:
+            with open(os.path.join(self.config["dir"], file)) as f:
+                content = f.read()
+            for name, body in re.findall(pattern, content, re.M | re.S):
+                found = re.findall(r"^\s*\+([A-Z]+)", body, re.M)
+                if found:
+                    tags[name] = helpers.unique(tags.get(name, []) + found)
+        return tags
+
     def _build_lexc(self) -> None:
         """
         Builds a lexc file from all specified files in lexc directory.
@@ -131,6 +346,8 @@ class FomaBuilder:
         sets up header/footer, and writes foma file.
             foma written to: "specified_directory/foma/name.foma"
             bin set up to: "specified_directory/foma/name.fomabin"
+        Rule definitions are compiled before the lexicon is read, and
+        loaded from a shared cache if an earlier build saved them.
         """
         self._build_rules()
 
@@ -138,14 +355,107 @@ class FomaBuilder:
         footer = "save stack {}".format(self.fomabin_filepath())
 
         with open(self.foma_filepath(), "w") as f:
+            if self._definitions:
+                f.write(self._build_definitions() + "\n\n")
             f.write(header + "\n\n")
             f.write(self._rules + "\n\n")
+            if self.config.get("lemmatizer"):
+                f.write(self._build_lemmatizer() + "\n\n")
             f.write(footer)
 
+    def _build_lemmatizer(self) -> str:
+        """
+        Returns the foma commands which build and save the lemmatizer
+        from the finished parser on the stack, then put the parser
+        back. The lemmatizer composes the parser with a projection of
+        its analyses down to their stems, as lemmatize finds them
+        (STEM_PAT: letters followed by a category tag), separated by
+        spaces and closed by LEMMATIZER_END: e.g. "sim+MDF w$an+N #"
+        for simiwani'm, and "#" for an analysis without stems.
+        Multicharacter symbols are spelled out first, so that stems
+        and tags match as they do in analysis strings. Stem characters
+        are those of STEM_PAT found in the lexc text, and tag letters
+        those of the tags among the multicharacter symbols.
+        """
+        symbols = [s for s in self._multichar_symbs.splitlines()[1:] if s]
+        flags = [s for s in symbols if re.match(r"^@.*@$", s)]
+        spelled = [s for s in symbols if s not in flags]
+        text = "".join(spelled) + self._stems + self._morphotactics
+        # the stem characters of STEM_PAT: letters, digits, _, ' and $
+        stem_chars = sorted(set(re.findall(r"[\w'$]", text)))
+        tags = [tag for s in spelled for tag in re.findall(r"\+([A-Z]+)", s)]
+        tag_chars = sorted(set("".join(tags)))
+
+        def union(items: list) -> str:
+            if not items:
+                return "~[?*]"  # the empty language
+            return " | ".join('"{}"'.format(item) for item in items)
+
+        def spell(symbol: str) -> str:
+            return '[ "{}" .x. {} ]'.format(
+                symbol, " ".join('"{}"'.format(char) for char in symbol)
+            )
+
+        return "\n".join(
+            [
+                "define Grammar ;",
+                "define LemmaSpell [ [ ? - [ {} ] ] | {} ]* ;".format(
+                    union(spelled), " | ".join(spell(s) for s in spelled)
+                ),
+                'define LemmaMark "<<" | ">>" ;',
+                "define LemmaChar {} ;".format(union(stem_chars)),
+                "define LemmaTag %+ [ {} ]+ ;".format(union(tag_chars)),
+                "define LemmaStems LemmaSpell",
+                '    .o. [ [ LemmaChar+ LemmaTag ] @-> "<<" ... ">>" ]',
+                "    .o. [ [ [ \\LemmaMark .x. 0 ]* "
+                '[ "<<":0 [ \\LemmaMark ]* ">>":" " ] ]* '
+                '[ \\LemmaMark .x. 0 ]* 0:"{}" ] ;'.format(LEMMATIZER_END),
+                "regex LemmaStems.i .o. Grammar ;",
+                "save stack {}".format(self.lemmatizer_filepath()),
+                "clear stack",
+                "regex Grammar ;",
+            ]
+        )
+
+    def definitions_filepath(self) -> str:
+        """
+        Generates the path of the cached, compiled rule definitions.
+        Named by a hash of the definitions (and the foma version) so
+        that every config sharing the same rules shares one cache.
+        It is kept in the output directory, or in the config's
+        "definitions_dir" (relative to the container dir) if given,
+        so that configs built to separate directories can share it.
+            e.g. configdir/foma/rules-0123456789abcdef.defined
+        Returns None if the rules files mark no definitions.
+        """
+        if not hasattr(self, "_definitions"):
+            self._build_rules()
+        if not self._definitions:
+            return None
+        digest = hashlib.sha256((foma_version() + self._definitions).encode())
+        filename = "rules-{}.defined".format(digest.hexdigest()[:16])
+        directory = self.output_dir()
+        if self.config.get("definitions_dir"):
+            directory = os.path.join(self.config["dir"], self.config["definitions_dir"])
+        return os.path.join(directory, filename)
+
+    def _build_definitions(self) -> str:
+        """
+        Returns the foma commands which define the rule networks:
+        a 'load defined' of the cache if it exists, or else the rule
+        definitions themselves followed by a 'save defined' to the cache.
+        """
+        cache = self.definitions_filepath()
+        if os.path.exists(cache):
+            return "load defined {}".format(cache)
+        return self._definitions + "\n\nsave defined {}".format(cache)
+
     def _build_rules(self) -> None:
         """
         Reads rules files, removes stem variation section unless
         dialect_variation parameter in config dictionary set to True.
+        Splits out the rule definitions section, if marked, from the
+        cascade which applies the rules to the lexicon.
         """
 
         self._rules = ""
@@ -166,6 +476,21 @@ class FomaBuilder:
                 valid_lines.append(line)
             self._rules = "\n".join(valid_lines)
 
+        self._split_definitions()
+
+    def _split_definitions(self) -> None:
+        """
+        Moves the sections between '! rule definitions' and
+        '! end rule definitions' comments out of the rules and into
+        a separate definitions chunk, saved to a variable on the
+        Builder object. These must only define networks, never
+        refer to the Lexicon.
+        """
+        pattern = r"^! rule definitions$(.*?)^! end rule definitions$"
+        sections = re.findall(pattern, self._rules, re.M | re.S)
+        self._definitions = "\n".join(section.strip("\n") for section in sections)
+        self._rules = re.sub(pattern, "", self._rules, flags=re.M | re.S).strip("\n")
+
     @staticmethod
     def _validate_config_file(config: dict) -> None:
         """
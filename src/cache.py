@@ -0,0 +1,358 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+
+MISSING = object()
+
+
+class LRUCache(MutableMapping):
+    """
+    Dictionary-like store of lookup results, bounded to maxsize
+    entries; once full, the least recently used entry is evicted.
+    Supports the usual mapping methods (keys, items, update, pop...).
+    With maxsize None the cache is unbounded (but still counted).
+    Counts hits and misses for get/get_many, and evictions.
+    With a DiskCache as store, entries are also written to disk under
+    the given kind, and entries missing from memory are read from it;
+    decode converts values read from disk (JSON) back to their type.
+    """
+
+    def __init__(
+        self, maxsize: int = None, store=None, kind: str = None, decode=None
+    ) -> None:
+        if maxsize is not None and maxsize < 0:
+            raise ValueError("Cache size must be None or at least 0")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._store = store
+        self._kind = kind
+        self._decode = decode
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for key, marking it as recently used,
+        or default if there is none. Counted as a hit or miss.
+        """
+        found, _ = self.get_many([key])
+        return found.get(key, default)
+
+    def get_many(self, keys: list) -> tuple:
+        """
+        Looks up each distinct key once. Returns a tuple of a dict of
+        the values found and a list of the missing keys, in input order.
+        The dict holds its own references to the values, so they can
+        be read after the missing keys are stored, even if storing
+        them evicts some of the keys found.
+        """
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self._data.get(key, MISSING)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                self._data.move_to_end(key)
+                found[key] = value
+        self.hits += len(found)
+
+        if self._store is not None and missing:
+            stored = self._store.get_many(self._kind, missing)
+            for key, value in stored.items():
+                if self._decode:
+                    value = self._decode(value)
+                self._insert(key, value)
+                found[key] = value
+            self.disk_hits += len(stored)
+            missing = [key for key in missing if key not in stored]
+
+        self.misses += len(missing)
+        return found, missing
+
+    def set_store(self, store) -> None:
+        """
+        Backs the cache with a disk store from now on.
+        """
+        self._store = store
+
+    def set_many(self, items: dict) -> None:
+        """
+        Stores several entries, writing them to the disk store (if
+        any) together in a single transaction.
+        """
+        self.persist_many(items)
+        for key, value in items.items():
+            self._insert(key, value)
+
+    def persist_many(self, items: dict) -> None:
+        """
+        Writes entries to the disk store only, if there is one.
+        """
+        if self._store is not None and items:
+            self._store.set_many(self._kind, items)
+
+    def stats(self) -> dict:
+        """
+        Returns the cache's size, size limit, and its hit, miss and
+        eviction counts. Hits read from the disk store are counted
+        separately as disk_hits.
+        """
+        stats = {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+        if self._store is not None:
+            stats["disk_hits"] = self.disk_hits
+        return stats
+
+    def clear(self) -> None:
+        """
+        Removes all entries; the counts are kept.
+        """
+        self._data.clear()
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        self._data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value) -> None:
+        if self._store is not None:
+            self._store.set(self._kind, key, value)
+        self._insert(key, value)
+
+    def _insert(self, key, value) -> None:
+        """
+        Stores an entry in memory, evicting the least recently used
+        entry if the cache is full.
+        """
+        if self.maxsize == 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def __delitem__(self, key) -> None:
+        del self._data[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __iter__(self):
+        # reading an entry moves it, so iterate over a snapshot of keys
+        return iter(list(self._data))
+
+
+class NegativeCache:
+    """
+    Bounded set of queries known to have no result, so that they can
+    be answered without a lookup. Exact rather than probabilistic (as
+    a Bloom filter would be): a query is only ever reported as having
+    no result if it has been added, so there are no false positives.
+    Once full, the least recently seen query is evicted.
+    """
+
+    def __init__(self, maxsize: int = None) -> None:
+        if maxsize is not None and maxsize < 0:
+            raise ValueError("Cache size must be None or at least 0")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.evictions = 0
+        # dicts keep insertion order, so the first key is the oldest
+        self._keys = {}
+        self._key_bytes = 0
+
+    def check(self, key) -> bool:
+        """
+        Returns whether key is known to have no result, marking it as
+        recently seen. Counted as a hit if so.
+        """
+        if key not in self._keys:
+            return False
+        del self._keys[key]
+        self._keys[key] = None
+        self.hits += 1
+        return True
+
+    def add(self, key) -> None:
+        """
+        Records that key has no result.
+        """
+        if self.maxsize == 0 or key in self._keys:
+            return
+        self._keys[key] = None
+        self._key_bytes += sys.getsizeof(key)
+        if self.maxsize is not None and len(self._keys) > self.maxsize:
+            oldest = next(iter(self._keys))
+            del self._keys[oldest]
+            self._key_bytes -= sys.getsizeof(oldest)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the number of queries held, size limit, hit and
+        eviction counts, false positive rate (always 0: the set is
+        exact), and approximate memory use in bytes.
+        """
+        return {
+            "size": len(self._keys),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "evictions": self.evictions,
+            "false_positive_rate": 0.0,
+            "memory": sys.getsizeof(self._keys) + self._key_bytes,
+        }
+
+    def clear(self) -> None:
+        self._keys.clear()
+        self._key_bytes = 0
+
+    def __contains__(self, key) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class DiskCache:
+    """
+    Persistent store of lookup results in a sqlite database, shared
+    by the caches of a Parser and kept between runs.
+    Results are kept per build: the sha256 of the compiled machine's
+    file. Opening the store for a new build of a file discards the
+    results stored for older builds of the same file, so results are
+    never served from a machine that has since been rebuilt; other
+    machines' results in the same database are untouched.
+    Values are stored as JSON; objects JSON has no type for (such as
+    Analysis) are stored as their strings.
+    The store can be used from any thread: its one connection is used
+    by one thread at a time. Once closed, it is reopened on next use.
+    """
+
+    def __init__(self, path: str, build_file: str) -> None:
+        self.build = self.file_hash(build_file)
+        self._name = os.path.abspath(build_file)
+        self._path = path
+        self._db = None
+        self._lock = threading.Lock()
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS builds"
+                    " (build TEXT PRIMARY KEY, name TEXT)"
+                )
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS results (build TEXT, kind TEXT,"
+                    " query TEXT, result TEXT, PRIMARY KEY (build, kind, query))"
+                )
+                self._prune()
+
+    def get_many(self, kind: str, keys: list) -> dict:
+        """
+        Returns a dict of the stored values for those keys which have
+        one, for the current build.
+        """
+        found = {}
+        with self._lock:
+            db = self._connect()
+            # stay well under sqlite's limit on query parameters
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = db.execute(
+                    "SELECT query, result FROM results WHERE build = ? AND kind = ?"
+                    " AND query IN ({})".format(", ".join("?" * len(chunk))),
+                    [self.build, kind] + chunk,
+                )
+                for query, result in rows:
+                    found[query] = json.loads(result)
+        return found
+
+    def set(self, kind: str, key: str, value) -> None:
+        """
+        Stores a value for the current build.
+        """
+        self.set_many(kind, {key: value})
+
+    def set_many(self, kind: str, items: dict) -> None:
+        """
+        Stores a dict of values for the current build, in a single
+        transaction.
+        """
+        rows = [
+            (self.build, kind, key, json.dumps(value, default=str))
+            for key, value in items.items()
+        ]
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", rows
+                )
+
+    def close(self) -> None:
+        """
+        Closes the database connection, if open.
+        """
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Returns the database connection, opening it if needed. It is
+        shared between threads, so only use it holding the lock.
+        """
+        if self._db is None:
+            self._db = sqlite3.connect(self._path, timeout=30, check_same_thread=False)
+            # a lost write only costs a lookup, so favour speed over safety
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        return self._db
+
+    def _prune(self) -> None:
+        """
+        Registers the current build and deletes the results of other
+        builds of the same file.
+        """
+        self._db.execute(
+            "DELETE FROM results WHERE build IN"
+            " (SELECT build FROM builds WHERE name = ? AND build != ?)",
+            (self._name, self.build),
+        )
+        self._db.execute(
+            "DELETE FROM builds WHERE name = ? AND build != ?",
+            (self._name, self.build),
+        )
+        self._db.execute(
+            "INSERT OR IGNORE INTO builds VALUES (?, ?)", (self.build, self._name)
+        )
+
+    @staticmethod
+    def file_hash(path: str) -> str:
+        """
+        Returns the sha256 hex digest of a file's contents.
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
@@ -22,6 +22,8 @@ from ctypes import *
 from ctypes.util import find_library
 
 fomalibpath = find_library('foma')
+if not fomalibpath:
+    raise ImportError("Cannot find the foma shared library (libfoma)")
 foma = cdll.LoadLibrary(fomalibpath)
 
 
@@ -104,8 +106,10 @@ foma_fsm_read_binary_file.restype = POINTER(FSTstruct)
 """Define functions."""
 foma_add_defined = foma.add_defined
 foma_add_defined.restype = c_int
-foma_add_defined_function = foma.add_defined_function
-foma_add_defined_function.restype = c_int
+# not exported by every libfoma build (e.g. some distro packages)
+foma_add_defined_function = getattr(foma, 'add_defined_function', None)
+if foma_add_defined_function is not None:
+    foma_add_defined_function.restype = c_int
 defined_networks_init = foma.defined_networks_init
 defined_networks_init.restype = c_void_p
 defined_functions_init = foma.defined_functions_init
@@ -158,13 +162,15 @@ class FST(object):
         # Prototype is a 2-tuple (name, (arg1name, ..., argname))
         # Definition is regex using prototype variables
         name = cls.encode(prototype[0] + '(')
+        if foma_add_defined_function is None:
+            raise NotImplementedError("libfoma lacks add_defined_function")
         if isinstance(definition, FST.string_type):
             numargs = len(prototype[1])
             for i in range(numargs):
                 definition = definition.replace(
                     prototype[1][i], "@ARGUMENT0%i@" % (i+1))
             regex = cls.encode(definition + ';')
-            retval = foma.add_defined_function(c_void_p(
+            retval = foma_add_defined_function(c_void_p(
                 cls.functiondefinitions.deffhandle), c_char_p(name), c_char_p(regex), c_int(numargs))
         else:
             raise ValueError("Expected regex as definition")
@@ -306,7 +312,7 @@ class FST(object):
     def __contains__(self, word):
         af = self.apply_down(word)
         try:
-            i = af.next()
+            i = next(af)
             return True
         except StopIteration:
             return False
@@ -1,50 +1,429 @@
+import codecs
 import os
+import random
+import select
 import subprocess
+import threading
 import re
+import weakref
+
+from .fomabin import FomaBinaryLookup, FomaBinError, read_alphabets
 
 
 class FomaError(Exception):
     pass
 
 
-class FomaReader:
+class FlookupProcess:
     """
-    Orchestrator object to interact with the foma subprocess.
-    Takes a foma file and optional foma binary file as input.
-    Runs the foma file and returns its output; lookup queries can
-    be made via flookup if a binary file is provided.
+    Long-lived flookup subprocess for one lookup direction.
+    Queries are written to the child's stdin one per line; flookup
+    answers each with one line per result and a blank line after the
+    last. The child is started on first use and restarted if it dies.
+    """
+
+    def __init__(self, bin_file: str, inverse: bool = False) -> None:
+        self._command = ["flookup", "-b", bin_file]
+        if inverse:
+            self._command.insert(1, "-i")
+        self._process = None
+        self._lock = threading.Lock()
+
+    def lookup(self, query: str) -> str:
+        """
+        Sends a single query to flookup and returns its results as a
+        newline-separated string, in the format of 'flookup -x'.
+        """
+        # a newline would split the query in two and desync the stream
+        query = " ".join(query.splitlines())
+
+        with self._lock:
+            try:
+                return self._communicate(query)
+            except (BrokenPipeError, FomaError):
+                # the child died since the last query; retry once
+                self.close()
+                return self._communicate(query)
+
+    def lookup_many(self, queries: list) -> list:
+        """
+        Streams a batch of queries through flookup in one pass and
+        returns a list of result strings aligned with the input.
+        Queries are written from a separate thread so that a full
+        output pipe can never block the writes.
+        """
+        queries = [" ".join(query.splitlines()) for query in queries]
+        if not queries:
+            return []
+
+        with self._lock:
+            try:
+                return self._communicate_many(queries)
+            except (BrokenPipeError, FomaError):
+                self.close()
+                return self._communicate_many(queries)
+
+    def close(self) -> None:
+        """
+        Closes the flookup child process, if one is running.
+        """
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        process.kill()
+        process.wait()
+        process.stdout.close()
+
+    def _start(self) -> subprocess.Popen:
+        """
+        Returns the running flookup child, starting one if needed.
+        """
+        if self._process is None or self._process.poll() is not None:
+            self.close()
+            self._process = subprocess.Popen(
+                self._command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+            )
+        return self._process
+
+    def _communicate(self, query: str) -> str:
+        """
+        Writes one query to the child process and reads its answer.
+        """
+        process = self._start()
+        process.stdin.write(query + "\n")
+        process.stdin.flush()
+        return self._read_result(query)
+
+    def _communicate_many(self, queries: list) -> list:
+        """
+        Writes a batch of queries to the child process while reading
+        the answers back in order.
+        """
+        process = self._start()
+        errors = []
+
+        def write_queries():
+            try:
+                for query in queries:
+                    process.stdin.write(query + "\n")
+                process.stdin.flush()
+            except OSError as e:
+                errors.append(e)
+
+        writer = threading.Thread(target=write_queries, daemon=True)
+        writer.start()
+        try:
+            results = [self._read_result(query) for query in queries]
+        finally:
+            writer.join()
+        if errors:
+            raise BrokenPipeError(errors[0])
+        return results
+
+    def _read_result(self, query: str) -> str:
+        """
+        Reads the lines flookup prints for a single query, up to the
+        blank separator line. Each line is echoed as 'query<TAB>result',
+        so empty results cannot be mistaken for the separator; the
+        echoed query is stripped before returning.
+        """
+        results = []
+        while True:
+            line = self._process.stdout.readline()
+            if not line:
+                raise FomaError("flookup exited while reading: {}".format(query))
+            line = line.rstrip("\n")
+            if not line:
+                return "\n".join(results)
+            results.append(line[len(query) + 1 :])
+
+    def __del__(self) -> None:
+        self.close()
+
+
+class LibfomaLookup:
+    """
+    In-process lookups for one direction through the libfoma bindings
+    in foma.py. The binary file is read once, and shared with the
+    lookups for the other direction; a single apply handle is reused
+    for every query. Results are formatted as flookup would print
+    them, so FlookupProcess and LibfomaLookup are interchangeable.
+    Raises FomaError if libfoma or the binary file cannot be loaded.
     """
 
-    def __init__(self, foma_file: str, bin_file: str = None) -> None:
+    _machines = weakref.WeakValueDictionary()
+    _machines_lock = threading.Lock()
+
+    def __init__(self, bin_file: str, inverse: bool = False) -> None:
+        # set first, so that close() works if loading the machine fails
+        self._handle = None
+        try:
+            from . import foma
+        except (ImportError, OSError) as e:
+            raise FomaError("libfoma backend unavailable: {}".format(e))
+
+        self._foma = foma
+        self._fst = self._load(foma, bin_file)
+        self._handle = foma.foma_apply_init(self._fst.fsthandle)
+        self._apply = foma.foma_apply_down if inverse else foma.foma_apply_up
+        self._lock = threading.Lock()
+
+    def lookup(self, query: str) -> str:
+        """
+        Applies the machine to a single query and returns its results
+        as a newline-separated string.
+        """
+        with self._lock:
+            return self._apply_query(query)
+
+    def lookup_many(self, queries: list) -> list:
+        """
+        Applies the machine to each query in turn and returns a list
+        of result strings aligned with the input.
+        """
+        with self._lock:
+            return [self._apply_query(query) for query in queries]
+
+    def close(self) -> None:
+        """
+        Frees the apply handle, and drops the loaded machine so that
+        it is freed once no longer referenced.
+        """
+        if self._handle:
+            self._foma.foma_apply_clear(self._foma.c_void_p(self._handle))
+            self._handle = None
+            self._fst = None
+
+    @classmethod
+    def _load(cls, foma, bin_file: str):
+        """
+        Returns the libfoma FST for a binary file, loaded once and
+        shared for as long as it is referenced, as in
+        FomaBinaryLookup.load. A rebuilt file is loaded afresh.
+        """
+        try:
+            key = (os.path.abspath(bin_file), os.stat(bin_file).st_mtime_ns)
+            with cls._machines_lock:
+                fst = cls._machines.get(key)
+                if fst is None:
+                    fst = foma.FST.load(bin_file)
+                    cls._machines[key] = fst
+                return fst
+        except (OSError, ValueError) as e:
+            raise FomaError("Cannot load foma binary {}: {}".format(bin_file, e))
+
+    def _apply_query(self, query: str) -> str:
+        """
+        Iterates over all outputs of the apply handle for one query.
+        """
+        if not self._handle:
+            raise FomaError("Lookup on a closed libfoma backend")
+
+        handle = self._foma.c_void_p(self._handle)
+        results = []
+        output = self._apply(handle, self._foma.c_char_p(query.encode("utf-8")))
+        while output is not None:
+            results.append(output.decode("utf-8"))
+            output = self._apply(handle, None)
+        return "\n".join(results)
+
+    def __del__(self) -> None:
+        self.close()
+
+
+LOOKUP_BACKENDS = {
+    "flookup": FlookupProcess,
+    "libfoma": LibfomaLookup,
+    "python": FomaBinaryLookup,
+}
+
+
+class FomaSession:
+    """
+    Long-lived interactive foma process. The foma file is sourced once
+    when the session starts; each later command is written to foma's
+    stdin and its output is read back up to the next 'foma[n]: '
+    prompt, so repeated commands never recompile the machine.
+    The session is restarted automatically if foma has exited.
+    """
+
+    PROMPT = re.compile(r"foma\[\d+\]: $")
+
+    def __init__(self, foma_file: str, timeout: float = 60) -> None:
         self._fomafile = foma_file
-        self._binfile = bin_file
-        self._validate()
-        self._load()
+        self.timeout = timeout
+        self._process = None
+        self._lock = threading.Lock()
 
-    def query(self, command: str, raw: bool = False) -> str:
+    def start(self) -> str:
+        """
+        Starts foma (if not already running) and sources the foma file.
+        Returns the output of the compilation; an empty string if the
+        session was already running.
+        """
+        with self._lock:
+            return self._start()
+
+    def run(self, command: str) -> str:
+        """
+        Runs a command in the session and returns its output, without
+        the echoed command line or the trailing prompt.
+        """
+        with self._lock:
+            self._start()
+            try:
+                output = self._communicate(command, self.timeout)
+            except FomaError:
+                self._close()
+                raise
+        # remove the line with the command that was called
+        return output.split("\n", 1)[1] if "\n" in output else ""
+
+    def close(self) -> None:
         """
-        Runs foma as a subprocess and returns the output of query.
+        Ends the foma process, if one is running.
         """
-        foma = subprocess.Popen(
+        with self._lock:
+            self._close()
+
+    def _start(self) -> str:
+        if self._process is not None and self._process.poll() is None:
+            return ""
+        self._close()
+        self._process = subprocess.Popen(
             ["foma"],
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
+            stderr=subprocess.STDOUT,
         )
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        try:
+            banner = self._read_to_prompt(self.timeout)
+            output = self._communicate("source {}".format(self._fomafile), None)
+        except FomaError:
+            self._close()
+            raise
+        return banner + output
 
+    def _close(self) -> None:
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        process.kill()
+        process.wait()
+        process.stdout.close()
+
+    def _communicate(self, command: str, timeout: float) -> str:
+        """
+        Writes a command and reads output up to the next foma prompt.
+        """
         try:
-            command = "source {}\n{}".format(self._fomafile, command)
-            outs, errs = foma.communicate(command, timeout=5)
-        except subprocess.TimeoutExpired:
-            foma.kill()
-            outs, errs = foma.communicate()
-            raise FomaError("Timeout...\nOutput: \n{}Errors:\n{}".format(outs, errs))
+            self._process.stdin.write((command + "\n").encode("utf-8"))
+            self._process.stdin.flush()
+        except OSError:
+            raise FomaError("foma exited before command: {}".format(command))
+        return self._read_to_prompt(timeout)
+
+    def _read_to_prompt(self, timeout: float) -> str:
+        """
+        Reads from foma's stdout until its output ends with a prompt.
+        Raises a FomaError if foma exits or the timeout (seconds, for
+        the whole read; None = no limit) expires first.
+        """
+        fd = self._process.stdout.fileno()
+        output = ""
+        while not self.PROMPT.search(output):
+            ready, _, _ = select.select([fd], [], [], timeout)
+            if not ready:
+                raise FomaError("Timeout...\nOutput: \n{}".format(output))
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise FomaError("foma exited.\nOutput: \n{}".format(output))
+            output += self._decoder.decode(chunk)
+        return self.PROMPT.sub("", output)
+
+    def __del__(self) -> None:
+        self._close()
+
+
+class FomaReader:
+    """
+    Orchestrator object to interact with the foma subprocess.
+    Takes a foma file and optional foma binary file as input.
+    Runs the foma file in a persistent foma session and returns its
+    output; lookup queries can be made via flookup if a binary file
+    is provided.
+    Lookups through flookup share one long-lived child per direction;
+    with backend="libfoma" they run in-process through libfoma, and
+    with backend="python" through the pure-Python engine in fomabin.py.
+    The python backend reads an up-to-date binary file directly and
+    only needs foma installed if the binary has to be compiled.
+    If the state/arc/path figures of a prebuilt binary are passed in
+    as stats, the foma file is not compiled until the session is used.
+    """
+
+    def __init__(
+        self,
+        foma_file: str,
+        bin_file: str = None,
+        backend: str = "flookup",
+        stats: dict = None,
+    ) -> None:
+        if backend not in LOOKUP_BACKENDS:
+            raise FomaError("Unknown lookup backend: {}".format(backend))
+        self._fomafile = foma_file
+        self._binfile = bin_file
+        self._backend = backend
+        self._flookups = {}
+        self._alphabets = {}
+        self._validate()
+        self._session = FomaSession(self._fomafile)
+        if stats and self._binfile:
+            # figures recorded when the binary was built; skip compiling
+            self.states, self.arcs, self.paths = (
+                stats["states"],
+                stats["arcs"],
+                stats["paths"],
+            )
+        else:
+            self._load()
+
+    @property
+    def foma_file(self) -> str:
+        """
+        The foma file the machine is compiled from.
+        """
+        return self._fomafile
 
+    @property
+    def bin_file(self) -> str:
+        """
+        The binary file used for lookups, or None if there is none.
+        """
+        return self._binfile
+
+    def query(self, command: str, raw: bool = False) -> str:
+        """
+        Runs a command in the foma session and returns its output.
+        The foma file is only compiled when the session starts.
+        """
+        outs = self._session.run(command)
         if raw:
             return outs
         else:
-            return self._format_foma_output(outs)
+            return outs.strip()
 
     def lookup(self, query: str, inverse: bool = False) -> list:
         """
@@ -54,37 +433,136 @@ class FomaReader:
             Reverse / inverse True = apply down (generate)
         """
         if self._binfile:
+            if self.unknown_symbols(query, inverse):
+                return []
             result = self._flookup(query, inverse)
             return self._flookup_as_list(result)
         else:
             command = "apply up\n" if not inverse else "apply down\n"
-            result = self.query(command + query)
+            result = self.query(command + " ".join(query.splitlines()) + "\nEND;")
             return self._format_applyx_as_list(result)
 
-    def _flookup(self, query: str, inverse: bool) -> str:
+    def lookup_many(self, queries: list, inverse: bool = False) -> list:
         """
-        Using the specified bin file, runs the flookup utility
-        (inverted if desired) and returns the output string.
+        Looks up a batch of queries in one pass and returns a list of
+        result lists, aligned with the input queries.
+        With a binary file, all queries share a single flookup stream;
+        otherwise each query is run through foma in turn.
         """
-        command = ["flookup", "-x", self._binfile]
-        if inverse:
-            command.insert(2, "-i")
+        if self._binfile:
+            # queries outside the alphabet are answered without a lookup
+            possible = [q for q in queries if not self.unknown_symbols(q, inverse)]
+            results = self._lookup_backend(inverse).lookup_many(possible)
+            found = dict(zip(possible, results))
+            return [self._flookup_as_list(found.get(q, "")) for q in queries]
+        else:
+            return [self.lookup(query, inverse) for query in queries]
+
+    def unknown_symbols(self, query: str, inverse: bool = False) -> set:
+        """
+        Returns the set of characters in a query which the machine
+        cannot consume in the given direction, so that a lookup would
+        find nothing. Always empty if the alphabet is not known (no
+        binary file) or the machine accepts any character.
+        """
+        alphabet = self._alphabet(inverse)
+        if alphabet is None:
+            return set()
+        return set(query) - alphabet
 
+    def load_alphabets(self) -> None:
+        """
+        Reads the alphabets used by unknown_symbols now, rather than on
+        the first lookup, if they are not read yet.
+        """
+        self._alphabet(False)
+
+    def sample_pairs(self, count: int, tag: str = None, seed: int = None) -> list:
+        """
+        Returns up to count distinct (analysis, surfaceform) pairs drawn
+        from the paths of the binary file, uniformly over paths, only
+        from analyses with the tag symbol if one is given (e.g. '+N').
+        A seed makes the draw repeatable.
+        """
         try:
-            echo = subprocess.Popen(["echo", query], stdout=subprocess.PIPE)
-            flookup = subprocess.Popen(
-                command, stdin=echo.stdout, stdout=subprocess.PIPE, text=True
-            )
-            echo.stdout.close()
+            fst = self._binary()
+            return fst.sample_pairs(count, tag, random.Random(seed))
+        except FomaBinError as e:
+            raise FomaError(str(e))
 
-            output, err = flookup.communicate()
-        finally:
-            echo.kill()
-            echo.wait()
-            flookup.kill()
-            flookup.wait()
+    def iter_pairs(self, max_depth: int = None):
+        """
+        Yields every (analysis, surfaceform) pair of the binary file,
+        following paths for at most max_depth arcs if given. A cyclic
+        machine has endless pairs, so max_depth is needed for one.
+        """
+        fst = self._binary()
+        if max_depth is None and fst.count_paths() < 0:
+            raise FomaError("A cyclic machine needs a maximum depth to list pairs")
+        return fst.iter_pairs(max_depth)
+
+    def close(self) -> None:
+        """
+        Shuts down the foma session and any lookup backends (e.g.
+        flookup child processes) held by the reader. They are
+        restarted by the next query or lookup.
+        """
+        self._session.close()
+        for flookup in self._flookups.values():
+            flookup.close()
+        self._flookups = {}
+
+    def _binary(self):
+        """
+        Returns the machine read from the binary file, loaded once
+        and shared with the python lookup backend.
+        """
+        if not self._binfile:
+            raise FomaError("This needs a foma binary file")
+        try:
+            return FomaBinaryLookup.load(self._binfile)
+        except FomaBinError as e:
+            raise FomaError(str(e))
 
-        return output
+    def _alphabet(self, inverse: bool) -> frozenset:
+        """
+        Returns the characters the machine can consume in the given
+        direction, read from the binary file on first use, or None if
+        any character can be consumed or there is no binary file.
+        The python backend loads the machine for lookups anyway; for
+        the others, only the symbols of its arcs are read.
+        """
+        if inverse not in self._alphabets:
+            # both directions are read from one load of the file
+            alphabets = {False: None, True: None}
+            try:
+                if self._binfile and self._backend == "python":
+                    # the machine is loaded for lookups anyway
+                    fst = self._binary()
+                    alphabets = {side: fst.alphabet(side) for side in alphabets}
+                elif self._binfile:
+                    alphabets = read_alphabets(self._binfile)
+            except (FomaError, FomaBinError):
+                pass
+            self._alphabets.update(alphabets)
+        return self._alphabets[inverse]
+
+    def _flookup(self, query: str, inverse: bool) -> str:
+        """
+        Using the specified bin file, queries the flookup utility
+        (inverted if desired) and returns the output string.
+        """
+        return self._lookup_backend(inverse).lookup(query)
+
+    def _lookup_backend(self, inverse: bool) -> FlookupProcess or LibfomaLookup:
+        """
+        Returns the lookup backend for the given direction, creating
+        it on first use.
+        """
+        if inverse not in self._flookups:
+            backend = LOOKUP_BACKENDS[self._backend]
+            self._flookups[inverse] = backend(self._binfile, inverse)
+        return self._flookups[inverse]
 
     def _load(self) -> None:
         """
@@ -93,7 +571,12 @@ class FomaReader:
         figures to variables stored in the FomaReader.
         Parses any foma warnings and prints them to console.
         """
-        raw_foma = self.query(None, raw=True)
+        if self._backend == "python" and self._binfile_is_current():
+            self._load_binary()
+            return
+
+        self._session.close()
+        raw_foma = self._session.start()
 
         # needs testing -- not sure if it displays warnings yet
         warnings = re.findall("(Warning: .*)", raw_foma)
@@ -110,6 +593,24 @@ class FomaReader:
         if not self._binfile and not self._seek_binfile(raw_foma):
             print("Warning: no binary file for this compilation; lookups are slow.")
 
+    def _load_binary(self) -> None:
+        """
+        Reads the state/arc/path figures from the binary file itself
+        instead of compiling the foma file.
+        """
+        fst = self._binary()
+        self.states, self.arcs = fst.states, fst.arcs
+        self.paths = fst.paths if fst.paths >= 0 else fst.count_paths()
+
+    def _binfile_is_current(self) -> bool:
+        """
+        Checks that a binary file exists and is at least as recent as
+        the foma file it was compiled from.
+        """
+        return bool(self._binfile) and (
+            os.path.getmtime(self._binfile) >= os.path.getmtime(self._fomafile)
+        )
+
     def _validate(self) -> None:
         """
         Ensures that input foma and bin paths lead to valid files.
@@ -152,25 +653,14 @@ class FomaReader:
             tuple(item.split("\t")) for item in text.splitlines() if item.strip() != ""
         ]
 
-    @staticmethod
-    def _format_foma_output(text: str) -> str:
-        """
-        Formats text output from foma as a nice text block.
-        Removes the initial blob from loading foma.
-        """
-        # remove output from loading foma
-        text = text.split("foma[1]:")[1]
-        # remove the line with the command that was called
-        text = text.split("\n", 1)[1]
-        return text.strip()
-
     @staticmethod
     def _format_applyx_as_list(text: str) -> list:
         """
         Formats text output from foma 'apply up/down' as a list
-        of the output lines. Strips the apply up/down query and prompt.
+        of the output lines. Strips the apply up/down query and prompt,
+        and the '???' foma prints when there is no result.
         """
-        return text.splitlines()[1:-1]
+        return [line for line in text.splitlines()[1:-1] if line != "???"]
 
     @staticmethod
     def _flookup_as_list(text: str) -> list:
@@ -0,0 +1,699 @@
+import gzip
+import os
+import random
+import re
+import threading
+import weakref
+from array import array
+
+
+class FomaBinError(Exception):
+    pass
+
+
+EPSILON = 0
+UNKNOWN = 1
+IDENTITY = 2
+
+FLAG_PAT = re.compile(r"^@([PNRDCUE])\.([^.@]+)(?:\.([^@]+))?@$")
+
+
+def read_alphabets(bin_file: str) -> dict:
+    """
+    Returns the alphabets of the first network in a binary file, as
+    FomaBinary.alphabet gives them, keyed by inverse: {False: lower
+    side alphabet, True: upper side alphabet}. The file is streamed
+    once and only the symbols of its arcs are kept, which is far
+    lighter than loading the network.
+    """
+    sigma = {}
+    consumed = {False: set(), True: set()}
+    try:
+        with gzip.open(bin_file, "rt", encoding="utf-8") as f:
+            if f.readline().rstrip("\n") != "##foma-net 1.0##":
+                raise FomaBinError("Not a foma binary file: {}".format(bin_file))
+            section = None
+            for line in f:
+                line = line.rstrip("\n")
+                if line.startswith("##") and line.endswith("##"):
+                    section = line
+                    if section == "##end##":
+                        break
+                elif section == "##sigma##":
+                    number, symbol = line.split(" ", 1)
+                    sigma[int(number)] = symbol
+                elif section == "##states##":
+                    # the arc forms of FomaBinary._read_states
+                    nums = line.split()
+                    if len(nums) == 5:
+                        upper, lower, target = nums[1:4]
+                    elif len(nums) == 4:
+                        upper, target = nums[1:3]
+                        lower = upper
+                    elif len(nums) == 3:
+                        upper, lower, target = nums
+                    elif len(nums) == 2:
+                        upper, target = nums
+                        lower = upper
+                    else:
+                        raise FomaBinError("Malformed state line: {}".format(line))
+                    if target != "-1":
+                        consumed[True].add(upper)
+                        consumed[False].add(lower)
+            else:
+                raise FomaBinError("Truncated foma binary file: {}".format(bin_file))
+    except (OSError, EOFError) as e:
+        raise FomaBinError("Cannot read foma binary {}: {}".format(bin_file, e))
+    return {
+        side: _alphabet({int(n) for n in numbers}, sigma)
+        for side, numbers in consumed.items()
+    }
+
+
+def read_props(bin_file: str) -> dict:
+    """
+    Returns the state, arc and path counts foma recorded for the first
+    network in a binary file (see FomaBinary._read_props), reading only
+    the header of the file.
+    """
+    try:
+        with gzip.open(bin_file, "rt", encoding="utf-8") as f:
+            if f.readline().rstrip("\n") != "##foma-net 1.0##":
+                raise FomaBinError("Not a foma binary file: {}".format(bin_file))
+            for line in f:
+                if line.rstrip("\n") == "##props##":
+                    props = f.readline().split(" ")
+                    return {
+                        "states": int(props[2]),
+                        "arcs": int(props[1]),
+                        "paths": int(props[5]),
+                    }
+    except (OSError, EOFError, IndexError, ValueError) as e:
+        raise FomaBinError("Cannot read foma binary {}: {}".format(bin_file, e))
+    raise FomaBinError("Truncated foma binary file: {}".format(bin_file))
+
+
+def _alphabet(consumed: set, sigma: dict) -> frozenset:
+    """
+    Returns the characters of the symbols numbered in consumed, leaving
+    out flag diacritics, or None if ?/@ is among them.
+    """
+    if UNKNOWN in consumed or IDENTITY in consumed:
+        return None
+    characters = set()
+    for number in consumed:
+        if number > IDENTITY and not FLAG_PAT.match(sigma[number]):
+            characters.update(sigma[number])
+    return frozenset(characters)
+
+
+class FomaBinary:
+    """
+    Pure-Python reader for the gzipped foma binary format written by
+    'save stack'. Loads the first network of the file into flat
+    array-backed transition tables and applies it up or down with
+    foma's epsilon and flag-diacritic semantics, so no foma install
+    is needed for lookups.
+    Arcs are stored as symbol pairs: 'upper' is the analysis side
+    and 'lower' the surface side.
+    """
+
+    def __init__(self, bin_file: str) -> None:
+        self.sigma = {}
+        self.flags = {}
+        self._read(bin_file)
+        self._make_tokenizer()
+        self._index = {False: {}, True: {}}
+        self._paths = None
+
+    def apply_up(self, word: str) -> list:
+        """
+        Returns all analyses (upper strings) for a surface word.
+        """
+        return self._apply(word, inverse=False)
+
+    def apply_down(self, word: str) -> list:
+        """
+        Returns all surface forms (lower strings) for an analysis.
+        """
+        return self._apply(word, inverse=True)
+
+    def alphabet(self, inverse: bool = False) -> frozenset:
+        """
+        Returns the set of characters found in the symbols the network
+        can consume when applied up (lower side) or, with inverse,
+        down (upper side); an input with any other character can have
+        no result. Returns None if that side has ?/@ arcs, which can
+        consume any character.
+        """
+        return _alphabet(set(self.upper if inverse else self.lower), self.sigma)
+
+    def count_paths(self) -> int:
+        """
+        Counts the paths from the start state to any final state, as
+        foma does (flag diacritics are not evaluated).
+        Returns -1 if the network is cyclic.
+        """
+        counts = self._path_counts()
+        return counts[0] if counts else 0
+
+    def _path_counts(self) -> list:
+        """
+        Returns a list holding, for each state, the number of paths
+        from that state to a final state. Returns [-1] if the network
+        contains a cycle reachable from the start state.
+        Counted on first use.
+        """
+        if self._paths is None:
+            self._paths = self._count_state_paths()
+        return self._paths
+
+    def _count_state_paths(self) -> list:
+        """
+        Counts the paths from each state, as for _path_counts.
+        """
+        count = len(self.final)
+        paths = [None] * count
+        on_stack = bytearray(count)
+        if not count:
+            return []
+
+        stack = [(0, self.offsets[0])]
+        on_stack[0] = 1
+        while stack:
+            state, arc = stack[-1]
+            if arc < self.offsets[state + 1]:
+                stack[-1] = (state, arc + 1)
+                target = self.target[arc]
+                if on_stack[target]:
+                    return [-1]
+                if paths[target] is None:
+                    on_stack[target] = 1
+                    stack.append((target, self.offsets[target]))
+                continue
+            stack.pop()
+            on_stack[state] = 0
+            paths[state] = self.final[state] + sum(
+                paths[self.target[a]]
+                for a in range(self.offsets[state], self.offsets[state + 1])
+            )
+        return paths
+
+    def iter_pairs(self, max_depth: int = None):
+        """
+        Yields the (upper, lower) pair of each path of the network,
+        depth first in file order of the arcs, skipping paths blocked
+        by flag diacritics. Paths which spell out the same pair yield
+        it once each. With max_depth, paths are followed for at most
+        that many arcs; without it, a cyclic network yields pairs
+        without end.
+        """
+        if not len(self.final):
+            return
+        if self.final[0]:
+            yield "", ""
+
+        upper = []
+        lower = []
+        # one frame per state on the current path: (state, next arc, flags)
+        stack = [(0, self.offsets[0], {})]
+        while stack:
+            state, arc, flags = stack[-1]
+            at_depth = max_depth is not None and len(upper) >= max_depth
+            if arc == self.offsets[state + 1] or at_depth:
+                stack.pop()
+                if upper:
+                    upper.pop()
+                    lower.pop()
+                continue
+            stack[-1] = (state, arc + 1, flags)
+
+            symbol = self.upper[arc]
+            if symbol in self.flags:
+                new_flags = self._check_flag(self.flags[symbol], flags)
+                if new_flags is None:
+                    continue
+            else:
+                new_flags = flags
+            target = self.target[arc]
+            upper.append(self._symbol_text(symbol, None))
+            lower.append(self._symbol_text(self.lower[arc], None))
+            stack.append((target, self.offsets[target], new_flags))
+            if self.final[target]:
+                yield "".join(upper), "".join(lower)
+
+    def sample_pairs(self, count: int, tag: str = None, rng=random) -> list:
+        """
+        Draws up to count distinct (upper, lower) pairs by picking paths
+        of the network uniformly at random, without replacement. The
+        draw is uniform over paths, not pairs: a pair spelled out by
+        several paths is that much more likely to be drawn, but is
+        returned only once. With tag (a symbol such as '+N'), only paths
+        whose upper side has that symbol are drawn. Paths blocked by
+        flag diacritics are skipped, so fewer than count pairs are
+        returned only when no more exist.
+        rng is a random.Random, or the random module.
+        Raises FomaBinError if the network is cyclic.
+        """
+        paths = self._path_counts()
+        if paths == [-1]:
+            raise FomaBinError("Cannot sample the paths of a cyclic network")
+        tags = None
+        if tag is not None:
+            tags = {n for n, symbol in self.sigma.items() if symbol == tag}
+        counts = self._tagged_path_counts(paths, tags) if tags is not None else paths
+
+        pairs = {}
+        total = counts[0] if counts else 0
+        for index in self._random_indices(total, rng):
+            pair = self._path_pair(self._unrank(index, paths, counts, tags))
+            if pair is not None:
+                pairs[pair] = None
+                if len(pairs) >= count:
+                    break
+        return list(pairs)
+
+    def _tagged_path_counts(self, paths: list, tags: set) -> list:
+        """
+        Returns a list holding, for each state, the number of paths
+        from that state to a final state with an upper symbol in tags,
+        given the path counts of an acyclic network.
+        """
+        tagged = [None] * len(paths)
+        # each state is summed up once all of its targets have been
+        stack = [0] if paths else []
+        while stack:
+            state = stack[-1]
+            targets = [
+                self.target[arc]
+                for arc in range(self.offsets[state], self.offsets[state + 1])
+                if tagged[self.target[arc]] is None
+            ]
+            if targets:
+                stack.extend(targets)
+                continue
+            stack.pop()
+            if tagged[state] is None:
+                tagged[state] = sum(
+                    paths[self.target[arc]]
+                    if self.upper[arc] in tags
+                    else tagged[self.target[arc]]
+                    for arc in range(self.offsets[state], self.offsets[state + 1])
+                )
+        return tagged
+
+    def _unrank(self, index: int, paths: list, counts: list, tags: set) -> list:
+        """
+        Returns the arcs of the path numbered index, counting paths in
+        file order of the arcs, with a path ending at a final state
+        before those running on from it. counts holds the number of
+        paths to count from each state: all of them (paths), or those
+        with a tag symbol still to come (counts of tagged paths).
+        """
+        arcs = []
+        state = 0
+        need_tag = tags is not None
+        while True:
+            if self.final[state] and not need_tag:
+                if index == 0:
+                    return arcs
+                index -= 1
+            for arc in range(self.offsets[state], self.offsets[state + 1]):
+                target = self.target[arc]
+                still_needed = need_tag and self.upper[arc] not in tags
+                number = (counts if still_needed else paths)[target]
+                if index < number:
+                    arcs.append(arc)
+                    state, need_tag = target, still_needed
+                    break
+                index -= number
+            else:
+                raise FomaBinError("Path number out of range")
+
+    def _path_pair(self, arcs: list) -> tuple:
+        """
+        Returns the (upper, lower) strings spelled out by a path, or
+        None if its flag diacritics block it.
+        """
+        flags = {}
+        upper = []
+        lower = []
+        for arc in arcs:
+            symbol = self.upper[arc]
+            if symbol in self.flags:
+                flags = self._check_flag(self.flags[symbol], flags)
+                if flags is None:
+                    return None
+            upper.append(self._symbol_text(symbol, None))
+            lower.append(self._symbol_text(self.lower[arc], None))
+        return "".join(upper), "".join(lower)
+
+    @staticmethod
+    def _random_indices(total: int, rng):
+        """
+        Yields the numbers 0 to total - 1 in random order, one at a
+        time. This is a Fisher-Yates shuffle that keeps only the swapped
+        positions, so memory grows with the numbers drawn, not total.
+        """
+        swapped = {}
+        for i in range(total):
+            j = rng.randrange(i, total)
+            yield swapped.get(j, j)
+            swapped[j] = swapped.pop(i, i)
+
+    def _read(self, bin_file: str) -> None:
+        """
+        Reads the props, sigma and states sections of the first
+        network in the binary file.
+        """
+        try:
+            with gzip.open(bin_file, "rt", encoding="utf-8") as f:
+                lines = iter(f.read().splitlines())
+        except (OSError, EOFError) as e:
+            raise FomaBinError("Cannot read foma binary {}: {}".format(bin_file, e))
+
+        if next(lines, None) != "##foma-net 1.0##":
+            raise FomaBinError("Not a foma binary file: {}".format(bin_file))
+
+        section = None
+        for line in lines:
+            if line.startswith("##") and line.endswith("##"):
+                section = line
+                if section == "##states##":
+                    self._read_states(lines)
+                elif section == "##end##":
+                    return
+            elif section == "##props##":
+                self._read_props(line)
+            elif section == "##sigma##":
+                number, symbol = line.split(" ", 1)
+                self.sigma[int(number)] = symbol
+
+        raise FomaBinError("Truncated foma binary file: {}".format(bin_file))
+
+    def _read_props(self, line: str) -> None:
+        """
+        Stores the state, arc and path counts recorded by foma.
+        A path count below zero means foma did not count the paths
+        (-1 cyclic, -2 overflow, -3 unknown).
+        """
+        props = line.split(" ")
+        self.arity = int(props[0])
+        self.arcs = int(props[1])
+        self.states = int(props[2])
+        self.paths = int(props[5])
+
+    def _read_states(self, lines) -> None:
+        """
+        Reads the states section into flat arrays. Each line is
+        one arc in one of foma's four forms:
+            state in out target final   (first arc of a state)
+            state in target final       (first arc, in == out)
+            in out target               (further arcs)
+            in target                   (further arcs, in == out)
+        A state without arcs is written with in and target -1; the
+        section ends with a line of five -1 values.
+        """
+        arcs = []
+        finals = set()
+        state = -1
+
+        for line in lines:
+            nums = [int(n) for n in line.split()]
+            if len(nums) == 5 and nums[0] == -1:
+                break
+            if len(nums) == 5:
+                state, upper, lower, target, final = nums
+            elif len(nums) == 4:
+                state, upper, target, final = nums
+                lower = upper
+            elif len(nums) == 3:
+                upper, lower, target = nums
+            elif len(nums) == 2:
+                upper, target = nums
+                lower = upper
+            else:
+                raise FomaBinError("Malformed state line: {}".format(line))
+
+            if len(nums) >= 4 and final:
+                finals.add(state)
+            arcs.append((state, upper, lower, target))
+
+        self._store_arcs(arcs, finals)
+
+    def _store_arcs(self, arcs: list, finals: set) -> None:
+        """
+        Stores arcs grouped by source state (in file order within each
+        state), so that the arcs of state s are found at positions
+        offsets[s] to offsets[s + 1] of the upper/lower/target arrays.
+        """
+        count = max(arc[0] for arc in arcs) + 1 if arcs else 0
+        counts = [0] * (count + 1)
+        for arc in arcs:
+            if arc[3] != -1:
+                counts[arc[0] + 1] += 1
+        for state in range(count):
+            counts[state + 1] += counts[state]
+        self.offsets = array("i", counts)
+
+        size = counts[-1]
+        self.upper = array("i", [0] * size)
+        self.lower = array("i", [0] * size)
+        self.target = array("i", [0] * size)
+        position = counts[:-1]
+        for state, upper, lower, target in arcs:
+            if target == -1:
+                continue
+            i = position[state]
+            self.upper[i], self.lower[i], self.target[i] = upper, lower, target
+            position[state] += 1
+
+        self.final = bytearray(count)
+        for state in finals:
+            self.final[state] = 1
+
+        for number, symbol in self.sigma.items():
+            match = FLAG_PAT.match(symbol)
+            if match:
+                self.flags[number] = match.groups()
+
+    def _make_tokenizer(self) -> None:
+        """
+        Prepares longest-match tokenization of input strings over the
+        symbols in sigma, as foma does before applying a network.
+        """
+        self._symbol_nums = {
+            symbol: number for number, symbol in self.sigma.items() if number > 2
+        }
+        self._symbol_lengths = sorted(
+            set(len(symbol) for symbol in self._symbol_nums), reverse=True
+        )
+
+    def _tokenize(self, word: str) -> list:
+        """
+        Splits a string into a list of (symbol number, text) pairs
+        using longest match. Characters outside sigma are marked as
+        IDENTITY so they can only pass through ?/@ arcs.
+        """
+        tokens = []
+        i = 0
+        while i < len(word):
+            for length in self._symbol_lengths:
+                number = self._symbol_nums.get(word[i : i + length])
+                if number is not None:
+                    tokens.append((number, word[i : i + length]))
+                    i += length
+                    break
+            else:
+                tokens.append((IDENTITY, word[i]))
+                i += 1
+        return tokens
+
+    def _arcs_from(self, state: int, inverse: bool) -> dict:
+        """
+        Returns the arcs leaving a state, grouped by the symbol they
+        consume in the given direction (built lazily per state).
+        Epsilon and flag arcs are grouped under EPSILON.
+        """
+        index = self._index[inverse]
+        arcs = index.get(state)
+        if arcs is None:
+            consumed = self.upper if inverse else self.lower
+            arcs = {}
+            for arc in range(self.offsets[state], self.offsets[state + 1]):
+                symbol = consumed[arc]
+                if symbol in self.flags:
+                    symbol = EPSILON
+                arcs.setdefault(symbol, []).append(arc)
+            index[state] = arcs
+        return arcs
+
+    def _apply(self, word: str, inverse: bool) -> list:
+        """
+        Depth-first traversal of the network over the tokenized input.
+        Follows epsilon arcs without consuming input, obeys flag
+        diacritics, and collects the other side of each complete path.
+        """
+        if not len(self.final):
+            return []
+        tokens = self._tokenize(word)
+        emitted = self.lower if inverse else self.upper
+        results = []
+
+        # stack items: (state, input position, output list, flag values,
+        #               states visited since input was last consumed)
+        stack = [(0, 0, (), {}, frozenset([0]))]
+        while stack:
+            state, pos, output, flags, visited = stack.pop()
+            if pos == len(tokens) and self.final[state]:
+                results.append("".join(output))
+
+            arcs = self._arcs_from(state, inverse)
+            candidates = arcs.get(EPSILON, [])
+            if pos < len(tokens):
+                number, text = tokens[pos]
+                candidates = candidates + arcs.get(number, [])
+                if number == IDENTITY:
+                    candidates = candidates + arcs.get(UNKNOWN, [])
+                candidates.sort()
+
+            pending = []
+            for arc in candidates:
+                target = self.target[arc]
+                symbol = emitted[arc]
+                consumed = self.lower[arc] if not inverse else self.upper[arc]
+                if consumed == EPSILON or consumed in self.flags:
+                    if target in visited:
+                        continue
+                    new_flags = flags
+                    if symbol in self.flags:
+                        new_flags = self._check_flag(self.flags[symbol], flags)
+                        if new_flags is None:
+                            continue
+                    pending.append(
+                        (
+                            target,
+                            pos,
+                            output + (self._symbol_text(symbol, None),),
+                            new_flags,
+                            visited | {target},
+                        )
+                    )
+                else:
+                    symbol = self._symbol_text(symbol, text)
+                    pending.append(
+                        (
+                            target,
+                            pos + 1,
+                            output + (symbol,),
+                            flags,
+                            frozenset([target]),
+                        )
+                    )
+
+            # reversed so that arcs are explored in file order
+            stack.extend(reversed(pending))
+
+        return results
+
+    def _symbol_text(self, number: int, text: str) -> str:
+        """
+        Returns the printed form of an output symbol.
+        """
+        if number == EPSILON or number in self.flags:
+            return ""
+        elif number == IDENTITY:
+            return text if text is not None else "@"
+        elif number == UNKNOWN:
+            return "?"
+        return self.sigma[number]
+
+    @staticmethod
+    def _check_flag(flag: tuple, flags: dict) -> dict:
+        """
+        Applies a flag diacritic to the current feature values.
+        Returns the updated values, or None if the flag blocks the path.
+        Values are stored as (value, negated) pairs.
+        """
+        kind, feature, value = flag
+        current, negated = flags.get(feature, (None, False))
+
+        if kind == "P":
+            return dict(flags, **{feature: (value, False)})
+        elif kind == "N":
+            return dict(flags, **{feature: (value, True)})
+        elif kind == "C":
+            return dict(flags, **{feature: (None, False)})
+        elif kind == "U":
+            if current is None:
+                return dict(flags, **{feature: (value, False)})
+            if (current == value) != negated:
+                if negated:
+                    return dict(flags, **{feature: (value, False)})
+                return flags
+            return None
+        elif kind == "R":
+            if current is None:
+                return None
+            if value is None or (current == value) != negated:
+                return flags
+            return None
+        elif kind == "D":
+            if current is None:
+                return flags
+            if value is None or (current == value) != negated:
+                return None
+            return flags
+        elif kind == "E":
+            if value is None:
+                return flags if current is None else None
+            return flags if current == value and not negated else None
+        return None
+
+
+class FomaBinaryLookup:
+    """
+    Lookup backend for FomaReader that applies a .fomabin file with
+    the pure-Python FomaBinary engine. Results are formatted as flookup
+    would print them, so it can stand in for FlookupProcess.
+    """
+
+    _machines = weakref.WeakValueDictionary()
+    _machines_lock = threading.Lock()
+
+    def __init__(self, bin_file: str, inverse: bool = False) -> None:
+        self._fst = self.load(bin_file)
+        self._apply = self._fst.apply_down if inverse else self._fst.apply_up
+
+    def lookup(self, query: str) -> str:
+        """
+        Applies the machine to a single query and returns its results
+        as a newline-separated string.
+        """
+        return "\n".join(self._apply(query))
+
+    def lookup_many(self, queries: list) -> list:
+        """
+        Applies the machine to each query and returns a list of
+        result strings aligned with the input.
+        """
+        return [self.lookup(query) for query in queries]
+
+    def close(self) -> None:
+        pass
+
+    @classmethod
+    def load(cls, bin_file: str) -> FomaBinary:
+        """
+        Returns the FomaBinary for a binary file. The file is loaded
+        once and shared (e.g. between lookups for both directions) for
+        as long as the machine is referenced. A rebuilt file (new
+        modification time) is loaded afresh.
+        """
+        key = (os.path.abspath(bin_file), os.stat(bin_file).st_mtime_ns)
+        with cls._machines_lock:
+            fst = cls._machines.get(key)
+            if fst is None:
+                fst = FomaBinary(bin_file)
+                cls._machines[key] = fst
+            return fst
@@ -2,11 +2,19 @@ import re
 
 
 def unique(orig: list) -> list:
-    new = []
-    for x in orig:
-        if x not in new:
-            new.append(x)
-    return new
+    """
+    Returns a new list of the distinct items of a list, in the order
+    they first appear. Items are compared in a set where they are
+    hashable, and one by one otherwise (e.g. for lists).
+    """
+    try:
+        return list(dict.fromkeys(orig))
+    except TypeError:
+        new = []
+        for x in orig:
+            if x not in new:
+                new.append(x)
+        return new
 
 
 # Git text conversion functions
@@ -71,6 +79,35 @@ def standardize_back(string: str, underline: str = UNDERSCORE) -> str:
     return re.sub(pat, underline, string)
 
 
+# Text tokenization
+
+APOSTROPHES = "'’ʼ"
+_WORD_PART = "(?:[^\\W\\d_]|[" + UNDERLINE_OPTIONS + APOSTROPHES + "])+"
+TOKEN_PAT = re.compile(_WORD_PART + "(?:[-=]" + _WORD_PART + ")*")
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits running text into Gitksan word tokens. A token is a run of
+    letters, underline marks (_ or combining lowline/macron) and
+    apostrophes, which may be joined by hyphens or clitic boundaries
+    (=). Punctuation, digits and spaces separate tokens.
+    Returns a list of (token, start, end) tuples, with the token's
+    character offsets in the text.
+    """
+    return [(m.group(), m.start(), m.end()) for m in TOKEN_PAT.finditer(text)]
+
+
+def token_to_query(token: str) -> str:
+    """
+    Returns the form of a text token to look up in the FST: lowercase,
+    with clitic boundaries (=) removed, plain apostrophes and
+    underscores for underlines.
+    """
+    token = re.sub("[" + APOSTROPHES + "]", "'", token.lower())
+    return convert_to_underscore(token.replace("=", ""))
+
+
 def standardize_palatal(string: str, use_kya: bool = False) -> str:
     """
     Input a string, returns a new string that standardizes the format
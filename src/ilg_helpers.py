@@ -1,58 +1,125 @@
+import functools
 import re
+from concurrent.futures import ProcessPoolExecutor
+
 from . import STEM_PAT
 
 
+# morpheme/tag replacements: fst style as key, story form as value
+REPLACEMENTS = {
+    "n$ee+AUX": 'NEG',
+    "y$ukw+AUX": 'PROG',
+    "d$im+MOD": 'PROSP',
+    "j$i+MOD": 'IRR',
+    "j$i+SUB": 'IRR',
+    "w$il+SUB": 'COMP',
+    "w$in+SUB": 'COMP',
+    "'$ii+SUB": 'CCNJ',
+    "w$ila+SUB": 'MANR',
+    "hl$aa+SUB": 'INCEP',
+    "hl$is+SUB": 'PERF',
+    "k_'$ap+MDF": 'VER',
+    "'$ap+MDF": 'VER',
+    "g_$an+MDF": 'REAS',
+    "g_$ay+MDF": 'CONTR',
+    "'$alp'a+ADV": 'RESTR',
+    "hind$a+ADV": 'WH',
+    "nd$a+ADV": 'WH',
+    "'$a+P": 'PREP',
+    "g_$o'o+P": 'LOC',
+    "g_$oo+P": 'LOC',
+    "g_$a'a+P": 'LOC',
+    "g_an+CNJ": 'PCNJ',
+    "'$ii+CNJ": 'CCNJ',
+    "'$oo+CNJ": 'or',
+    "=YNQ": '=Q',
+    "+PRO": '',
+    "+OP": '',
+}
+
+# specific rewrites where fst and story breakdowns differ
+REWRITES = [
+    (r"(\w+)\+OBL", r"OBL-\1.II"),
+    (r"(\w+)\+DEM", r"DEM.\1"),
+    (r"(\d)SG\+QUOT", r"\1.I=QUOT"),
+    (r"3PL\+QUOT", r"3.I=QUOT.3PL"),
+    (r"(\d)PL\+QUOT", r"\1.I=QUOT.PL"),
+]
+
+# all of the above as one alternation, tried in the order listed at each
+# position; each is a named group, followed by a rewrite's own groups
+GLOSS_PAT = re.compile("|".join(
+    ["(?P<r{}>{})".format(i, re.escape(key)) for i, key in enumerate(REPLACEMENTS)]
+    + ["(?P<w{}>{})".format(i, pat) for i, (pat, _) in enumerate(REWRITES)]
+))
+# what each named group is replaced with, as a match.expand template:
+# literal for replacements, with \1 renumbered for rewrites
+GLOSS_TEMPLATES = {
+    "r{}".format(i): value.replace("\\", "\\\\")
+    for i, value in enumerate(REPLACEMENTS.values())
+}
+for i, (_, repl) in enumerate(REWRITES):
+    group = GLOSS_PAT.groupindex["w{}".format(i)]
+    GLOSS_TEMPLATES["w{}".format(i)] = repl.replace(
+        "\\1", "\\g<{}>".format(group + 1)
+    )
+STEM_RE = re.compile(STEM_PAT)
+
+# In analyses as the FST writes them, every tag ends its morpheme, so
+# each morpheme (with a clitic's =) converts on its own. In any other
+# string, the output of one replacement can run into the next one,
+# which only the step-by-step conversion gets right.
+MORPHEME_SPLIT = re.compile(r"([-~\[\]()<>@\s.]|=(?!YNQ))")
+UNUSUAL_PAT = re.compile(
+    r"(?<![\w'$])\+|\+(?![A-Z])|\+[A-Z]+[^-=~\[\]()<>@\s.A-Z]|=YNQ[\w'$+]"
+)
+
+
+def _replace_gloss_match(match) -> str:
+    return match.expand(GLOSS_TEMPLATES[match.lastgroup])
+
+
+@functools.lru_cache(maxsize=65536)
 def fst_to_story_gloss(fst_gloss: str) -> str:
     """ 
     Input a gloss from the FST to convert it approximately to how it
     would look in the Gitksan interlinear gloss format used in stories.
     Instead of a definition for main stems, an empty '___' is used.
         - fst_gloss: string output from the parser
+    Converted glosses are remembered, as the same analyses come up
+    again and again.
+    """
+    if UNUSUAL_PAT.search(fst_gloss):
+        return _convert_stepwise(fst_gloss)
+    return "".join(map(_convert_morpheme, MORPHEME_SPLIT.split(fst_gloss)))
+
+
+@functools.lru_cache(maxsize=65536)
+def _convert_morpheme(morpheme: str) -> str:
+    """
+    Converts one morpheme of a gloss in a single pass over the
+    replacements and rewrites, then replaces a stem with '___'.
+    """
+    if "+" not in morpheme and "YNQ" not in morpheme:
+        return morpheme
+    new_gloss = GLOSS_PAT.sub(_replace_gloss_match, morpheme)
+    return STEM_RE.sub('___', new_gloss)
+
+
+def _convert_stepwise(fst_gloss: str) -> str:
+    """
+    Converts a gloss as fst_to_story_gloss does, applying each
+    replacement and rewrite to the whole gloss in turn.
     """
     new_gloss = fst_gloss
-    # morpheme/tag replacements: fst style as key, story form as value
-    replacements = {
-        "n$ee+AUX": 'NEG',
-        "y$ukw+AUX": 'PROG',
-        "d$im+MOD": 'PROSP',
-        "j$i+MOD": 'IRR',
-        "j$i+SUB": 'IRR',
-        "w$il+SUB": 'COMP',
-        "w$in+SUB": 'COMP',
-        "'$ii+SUB": 'CCNJ',
-        "w$ila+SUB": 'MANR',
-        "hl$aa+SUB": 'INCEP',
-        "hl$is+SUB": 'PERF',
-        "k_'$ap+MDF": 'VER',
-        "'$ap+MDF": 'VER',
-        "g_$an+MDF": 'REAS',
-        "g_$ay+MDF": 'CONTR',
-        "'$alp'a+ADV": 'RESTR',
-        "hind$a+ADV": 'WH',
-        "nd$a+ADV": 'WH',
-        "'$a+P": 'PREP',
-        "g_$o'o+P": 'LOC',
-        "g_$oo+P": 'LOC',
-        "g_$a'a+P": 'LOC',
-        "g_an+CNJ": 'PCNJ',
-        "'$ii+CNJ": 'CCNJ',
-        "'$oo+CNJ": 'or',
-        "=YNQ": '=Q',
-        "+PRO": '',
-        "+OP": '',
-    }
-    for fst_ver, ilg_ver in replacements.items():
+    for fst_ver, ilg_ver in REPLACEMENTS.items():
         new_gloss = new_gloss.replace(fst_ver, ilg_ver)
-    # specific replacements where fst and story breakdowns differ
-    new_gloss = re.sub(r"(\w+)\+OBL", r"OBL-\1.II", new_gloss)
-    new_gloss = re.sub(r"(\w+)\+DEM", r"DEM.\1", new_gloss)
+    for pattern, repl in REWRITES[:2]:
+        new_gloss = re.sub(pattern, repl, new_gloss)
     if '+QUOT' in new_gloss:
-        new_gloss = re.sub(r"(\d)SG\+QUOT", r"\1.I=QUOT", new_gloss)
-        new_gloss = re.sub(r"3PL\+QUOT", r"3.I=QUOT.3PL", new_gloss)
-        new_gloss = re.sub(r"(\d)PL\+QUOT", r"\1.I=QUOT.PL", new_gloss)
-    # replace various stems with '___'
-    new_gloss = re.sub(STEM_PAT, '___', new_gloss)
-    return new_gloss
+        for pattern, repl in REWRITES[2:]:
+            new_gloss = re.sub(pattern, repl, new_gloss)
+    return STEM_RE.sub('___', new_gloss)
 
 def filter_matching_glosses(analyses: list, story_gloss: str) -> list:
     """
@@ -77,6 +144,40 @@ def filter_matching_glosses(analyses: list, story_gloss: str) -> list:
     return sorted(options.items(), reverse=True, 
                     key=lambda pair: options[pair[0]])
 
+def validate_glosses(items: list, workers: int = 1, chunk_size: int = 1000) -> list:
+    """
+    Scores many (analyses, story gloss) items at once, as
+    filter_matching_glosses does for one. Returns a list of the
+    filtered, scored analyses (list of 2-tuples (str, num)) aligned
+    with the input. Repeated items are scored once. With more than
+    one worker, items are scored in chunks in a process pool
+    (workers None: one per CPU); with workers 1 or less, in process.
+    """
+    distinct = list(dict.fromkeys(
+        (tuple(analyses), story_gloss) for analyses, story_gloss in items
+    ))
+    if workers is not None and workers <= 1:
+        scored = _validate_chunk(distinct)
+    else:
+        chunks = [
+            distinct[i : i + chunk_size] for i in range(0, len(distinct), chunk_size)
+        ]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_validate_chunk, chunks)
+            scored = [scores for chunk in results for scores in chunk]
+
+    found = dict(zip(distinct, scored))
+    return [
+        list(found[tuple(analyses), story_gloss]) for analyses, story_gloss in items
+    ]
+
+def _validate_chunk(items: list) -> list:
+    return [
+        filter_matching_glosses(analyses, story_gloss)
+        for analyses, story_gloss in items
+    ]
+
+@functools.lru_cache(maxsize=65536)
 def match_score(converted_gloss: str, story_gloss: str) -> int:
     """
     Given a FST output analysis converted to its closest interlinear
@@ -84,27 +185,23 @@ def match_score(converted_gloss: str, story_gloss: str) -> int:
     provides a numeric score from 0 to 1 indicating how likely the two
     gloss strings are to be a match. 0 = no match, 1 = exact match.
     Floats between 0 and 1 can be used to sort match goodness.
+    Scores are remembered for each pair of glosses.
     """
     if converted_gloss == story_gloss:
         # find exact match
         return 1
     else:
         # reject analysis with no match when using simple wildcard
-
-        # remove brackets around -T/-TR in story string
-        story_gloss = re.sub(r'\[(-TR?)', r'\1', story_gloss)
-        story_gloss = re.sub(r'(-TR?)\]', r'\1', story_gloss)
-
-        pattern = re.sub('___', '.+', re.escape(converted_gloss))
-        if not re.match(pattern, story_gloss):
+        story_gloss = _unbracket_story_gloss(story_gloss)
+        if not _wildcard_pattern(converted_gloss).match(story_gloss):
             return 0
 
     # otherwise, generate score based on number of fst morphemes
     # that match morphemes in ilg gloss (reject if not found)
     score = 0.5
 
-    fst_morphs = re.split(r'[\-=~\[\]\(\)<>]+', converted_gloss)
-    ilg_morphs = re.split(r'[\-=~\[\]\(\)<>]+', story_gloss)
+    fst_morphs = _split_morphemes(converted_gloss)
+    ilg_morphs = frozenset(_split_morphemes(story_gloss))
 
     # refactor if we need to consider duplicate morphemes (TODO)
     for morph in fst_morphs:
@@ -118,3 +215,26 @@ def match_score(converted_gloss: str, story_gloss: str) -> int:
             break
     
     return round(score, 3)
+
+@functools.lru_cache(maxsize=65536)
+def _unbracket_story_gloss(story_gloss: str) -> str:
+    """
+    Removes the brackets around -T/-TR in a story gloss.
+    """
+    story_gloss = re.sub(r'\[(-TR?)', r'\1', story_gloss)
+    return re.sub(r'(-TR?)\]', r'\1', story_gloss)
+
+@functools.lru_cache(maxsize=65536)
+def _wildcard_pattern(converted_gloss: str):
+    """
+    Returns a compiled pattern matching the converted gloss, with any
+    string standing in for each '___'.
+    """
+    return re.compile(re.sub('___', '.+', re.escape(converted_gloss)))
+
+@functools.lru_cache(maxsize=65536)
+def _split_morphemes(gloss: str) -> tuple:
+    """
+    Returns the morphemes of a gloss, split at boundaries and brackets.
+    """
+    return tuple(re.split(r'[\-=~\[\]\(\)<>]+', gloss))
@@ -1,10 +1,17 @@
-import re
+import gzip
+import itertools
 import json
 import os
+import sys
+import threading
+import weakref
 
-from . import helpers, ilg_helpers, STEM_PAT
-from .builder import FomaBuilder
-from .foma_reader import FomaReader
+from . import helpers, ilg_helpers
+from .analysis import parse_analysis
+from .builder import LEMMATIZER_END, FomaBuilder
+from .cache import DiskCache, LRUCache, MISSING, NegativeCache
+from .foma_reader import FomaError, FomaReader
+from .fomabin import FomaBinError, read_props
 
 
 class ParserError(Exception):
@@ -27,46 +34,289 @@ class Parser:
 
     load_input = path to a foma file or json configuration file
                 default: 'fst/full_dialectal.json'
+    backend = how lookups are run against the compiled binary:
+                'flookup' (default), 'libfoma' (in-process via the
+                foma library) or 'python' (pure-Python, no foma needed
+                once the binary is built)
+    cache_size = the most results kept in memory for each of analyze,
+                generate and lemmatize, least recently used dropped first
+                default: None (unlimited)
+    negative_cache_size = the most wordforms without any analysis
+                remembered (these are kept apart from the results)
+                default: None (unlimited)
+    persistent_cache = path to a sqlite file in which results are also
+                saved, to be reused by later runs until the compiled
+                binary changes
+                default: None (results are kept in memory only)
+    lazy = if True, only checks the input when the parser is created;
+                the FST is built and loaded on first use, or by warm()
+                default: False
+    shared = if True, parsers for the same input and settings share
+                one loaded FST, its lookup processes and result caches;
+                these are closed along with the last such parser
+                default: False
     """
 
-    def __init__(self, load_input: str or dict = FULL_EW) -> None:
+    def __init__(
+        self,
+        load_input: str or dict = FULL_EW,
+        backend: str = "flookup",
+        cache_size: int = None,
+        persistent_cache: str = None,
+        negative_cache_size: int = None,
+        lazy: bool = False,
+        shared: bool = False,
+    ) -> None:
+        self.backend = backend
+        self.cache_size = cache_size
+        self.negative_cache_size = negative_cache_size
+        self.persistent_cache = persistent_cache
+        self.lazy = lazy
+        self.shared = shared
+        self._release = None
         self.reload(load_input)
 
     def reload(self, load_input: str or dict) -> None:
 
         if type(load_input) is dict:
-            foma_location, bin_location = self._build(load_input)
+            FomaBuilder(load_input)  # validates the config
         elif type(load_input) is str and load_input[-5:] == ".foma":
-            foma_location, bin_location = load_input, None
+            if not os.path.exists(load_input):
+                raise FileNotFoundError("Cannot find foma file: {}".format(load_input))
         elif type(load_input) is str and load_input[-5:] == ".json":
             with open(load_input) as f:
                 load_input = json.load(f)
-            foma_location, bin_location = self._build(load_input)
+            FomaBuilder(load_input)
         else:
             raise ParserError("Unknown file type provided for foma file")
 
-        # TODO: validate to make sure foma location exists/is file
+        if self._release:
+            self._release()
+        if self.shared:
+            key = self._state_key(load_input)
+            with _shared_lock:
+                state = _shared_states.get(key)
+                if state is None:
+                    state = _shared_states[key] = _ParserState(load_input, self)
+                state.refs += 1
+        else:
+            key, state = None, _ParserState(load_input, self)
+        self._state = state
+        self._release = weakref.finalize(self, _release_state, key, state)
+
+        self.analyzer_dict = state.analyzer_dict
+        self.negative_cache = state.negative_cache
+        self.generator_dict = state.generator_dict
+        self.lemmatizer_dict = state.lemmatizer_dict
+        if not self.lazy:
+            self.warm()
+
+    def warm(self) -> None:
+        """
+        Builds and loads the FST now, if it is not loaded yet.
+        A lazy parser does this on first use; call it to pay the
+        cost up front instead (e.g. at service startup).
+        """
+        state = self._state
+        with state.lock:
+            if state.reader is not None:
+                return
+            if type(state.load_input) is dict:
+                reader = self._build(state.load_input)
+                state.lemmatizer = self._lemmatizer(state.load_input)
+            else:
+                reader = FomaReader(state.load_input, None, self.backend)
+
+            if self.persistent_cache:
+                build_file = reader.bin_file or reader.foma_file
+                store = state.store = DiskCache(self.persistent_cache, build_file)
+                for cache in (
+                    self.analyzer_dict,
+                    self.generator_dict,
+                    self.lemmatizer_dict,
+                ):
+                    cache.set_store(store)
+            state.reader = reader
+
+    def close(self) -> None:
+        """
+        Shuts down the foma/flookup processes of the parser. For a
+        shared parser, only once no other parser is using them.
+        This also happens when the parser is garbage collected.
+        """
+        self._release()
+
+    def __enter__(self) -> "Parser":
+        return self
 
-        self._reader = FomaReader(foma_location, bin_location)
-        self.analyzer_dict = {}
-        self.generator_dict = {}
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
-    def analyze(self, query: str, gloss_validator: str = None) -> list:
+    @property
+    def loaded(self) -> bool:
+        """
+        Whether the FST has been built and loaded.
+        """
+        return self._state.reader is not None
+
+    @property
+    def _reader(self) -> FomaReader:
+        """
+        The reader for the loaded FST, loading it first if needed.
+        """
+        if self._state.reader is None:
+            self.warm()
+        return self._state.reader
+
+    def analyze(
+        self, query: str, gloss_validator: str = None, structured: bool = False
+    ) -> list:
         """
         Input a surface wordform; returns list of possible analyses.
         Saves wordforms to internal dictionary if not already present.
+        With structured, the analyses are returned as Analysis objects,
+        parsed into their stems, tags and clitics (as they are cached).
         """
         query = helpers.convert_to_underscore(query)
 
         if gloss_validator:
             # triggers one self-referential lookup without validators
             full_result = self.analyze_properties(query, gloss_validator)
-            return full_result["validated"]
+            result = full_result["validated"]
+            if structured:
+                return [parse_analysis(analysis) for analysis in result]
+            return result
 
         # base case for analyze and analyze_properties recursive lookup
-        if query not in self.analyzer_dict:
-            self.analyzer_dict[query] = self._reader.lookup(query)
-        return self.analyzer_dict[query]
+        found, misses = self.cached_analyses([query])
+        if misses:
+            found = self.save_analyses({query: self._reader.lookup(query)})
+        if structured:
+            return list(found[query])
+        return [analysis.raw for analysis in found[query]]
+
+    def analyze_many(self, queries: list, structured: bool = False) -> list:
+        """
+        Input a list of surface wordforms; returns a list of analysis
+        lists aligned with the input. Repeated and previously seen
+        wordforms are answered from the internal dictionary; the rest
+        are looked up together in a single pass.
+        With structured, analyses are returned as Analysis objects.
+        """
+        queries = [helpers.convert_to_underscore(query) for query in queries]
+
+        found, misses = self.cached_analyses(queries)
+        results = dict(zip(misses, self._reader.lookup_many(misses)))
+        found.update(self.save_analyses(results))
+
+        if structured:
+            return [list(found[query]) for query in queries]
+        return [[analysis.raw for analysis in found[query]] for query in queries]
+
+    def cached_analyses(self, queries: list) -> tuple:
+        """
+        Looks up each distinct wordform among the known unanalyzable
+        wordforms, then in the analysis cache. Returns a tuple of a
+        dict of the analyses found and a list of the wordforms still
+        to be looked up, e.g. by another lookup front end such as
+        AsyncParser, which then passes the results to save_analyses.
+        """
+        found = {}
+        unknown = []
+        for query in dict.fromkeys(queries):
+            if self.negative_cache.check(query):
+                found[query] = []
+            else:
+                unknown.append(query)
+
+        cached, misses = self.analyzer_dict.get_many(unknown)
+        for query, result in cached.items():
+            if not result:
+                # read from the persistent cache; keep it apart as well
+                self.negative_cache.add(query)
+                if query in self.analyzer_dict:
+                    del self.analyzer_dict[query]
+        found.update(cached)
+        return found, misses
+
+    def save_analyses(self, results: dict) -> dict:
+        """
+        Caches the analyses of a dict of wordforms as Analysis objects,
+        writing them to the persistent cache (if any) in one go.
+        Wordforms without analyses are remembered in the negative cache
+        instead, and only saved to the persistent cache.
+        Returns a dict of the wordforms' Analysis lists.
+        """
+        analyzed = {}
+        unanalyzed = {}
+        for query, result in results.items():
+            if result:
+                analyzed[query] = self._analyses_from_json(result)
+            else:
+                self.negative_cache.add(query)
+                unanalyzed[query] = result
+        self.analyzer_dict.set_many(analyzed)
+        self.analyzer_dict.persist_many(unanalyzed)
+        analyzed.update(unanalyzed)
+        return analyzed
+
+    def analyze_text(self, text: str) -> list:
+        """
+        Input running text; returns a list with a dict for each word
+        token (see helpers.tokenize), in order:
+            {"token": "Gat", "start": 0, "end": 3, "analyses": [...]}
+        start and end are the token's character offsets in the text.
+        Each distinct word is looked up once, in a single pass.
+        """
+        return self._analyze_tokens([text])[0]
+
+    def iter_analyze_lines(self, fileobj, batch_size: int = 1000):
+        """
+        Input an iterable of lines of text, such as an open file;
+        yields a list of token dicts (as for analyze_text) for each
+        line, in order, with offsets within the line.
+        Lines are read in batches of at least batch_size tokens, and
+        the distinct words of each batch are looked up in one pass.
+        """
+        batch = []
+        size = 0
+        for line in fileobj:
+            batch.append(line)
+            size += len(line.split())
+            if size >= batch_size:
+                yield from self._analyze_tokens(batch)
+                batch = []
+                size = 0
+        if batch:
+            yield from self._analyze_tokens(batch)
+
+    def _analyze_tokens(self, texts: list) -> list:
+        """
+        Tokenizes each text and looks up the distinct words of all of
+        them together. Returns a list of token dict lists aligned with
+        the input.
+        """
+        tokenized = [helpers.tokenize(text) for text in texts]
+        queries = {
+            token: helpers.token_to_query(token)
+            for tokens in tokenized
+            for token, _, _ in tokens
+        }
+        distinct = list(dict.fromkeys(queries.values()))
+        found = dict(zip(distinct, self.analyze_many(distinct)))
+
+        return [
+            [
+                {
+                    "token": token,
+                    "start": start,
+                    "end": end,
+                    "analyses": found[queries[token]],
+                }
+                for token, start, end in tokens
+            ]
+            for tokens in tokenized
+        ]
 
     def analyze_to_ilg(self, query: str) -> list:
         """
@@ -76,21 +326,57 @@ class Parser:
         Stems are given as ___ rather than as a one-word definition.
         """
         fst_output = self.analyze(query)
-        converted = [
-            ilg_helpers.fst_to_story_gloss(res, STEM_PAT) for res in fst_output
-        ]
+        converted = [ilg_helpers.fst_to_story_gloss(res) for res in fst_output]
         return helpers.unique(converted)
 
     def generate(self, query: str) -> list:
         """
         Input a foma analysis; returns list of possible surface
         wordforms. Saves analyses to an internal dictionary.
+        An analysis with symbols outside the FST's alphabet has none;
+        unknown_symbols(query, inverse=True) lists them.
         """
-        if query not in self.generator_dict:
+        result_list = self.generator_dict.get(query)
+        if result_list is None:
             result_list = self._reader.lookup(query, inverse=True)
             result_list = [helpers.convert_to_macron(item) for item in result_list]
             self.generator_dict[query] = result_list
-        return self.generator_dict[query]
+        return result_list
+
+    def generate_many(self, queries: list) -> list:
+        """
+        Input a list of foma analyses; returns a list of surface
+        wordform lists aligned with the input. Analyses not already in
+        the internal dictionary are looked up together in one pass.
+        """
+        found, misses = self.generator_dict.get_many(queries)
+        results = {
+            query: [helpers.convert_to_macron(item) for item in result_list]
+            for query, result_list in zip(
+                misses, self._reader.lookup_many(misses, inverse=True)
+            )
+        }
+        self.generator_dict.set_many(results)
+        found.update(results)
+
+        return [found[query] for query in queries]
+
+    def cache_stats(self) -> dict:
+        """
+        Returns the size, size limit, and hit/miss/eviction counts
+        of the analyze, generate and lemmatize result caches, e.g.
+            {"analyze": {"size": 10, "maxsize": None, "hits": 3, ...},
+             "generate": {...}, "lemmatize": {...}}
+        With a persistent cache, results read from it are counted
+        as disk_hits. Wordforms without analyses are reported under
+        "unanalyzed", with the memory they take up.
+        """
+        return {
+            "analyze": self.analyzer_dict.stats(),
+            "generate": self.generator_dict.stats(),
+            "lemmatize": self.lemmatizer_dict.stats(),
+            "unanalyzed": self.negative_cache.stats(),
+        }
 
     def lemmatize(self, form: str) -> list:
         """
@@ -104,23 +390,62 @@ class Parser:
         with slashes within the first tuple element:
             e.g. ("form/Form", "X")
         """
-        parses = self.analyze(form)
-        if not parses:
-            return None
+        return self.lemmatize_many([form])[0]
+
+    def lemmatize_many(self, forms: list) -> list:
+        """
+        Input a list of words; returns a list of their lemmatize
+        results, aligned with the input. Words not already in the
+        internal dictionary are lemmatized together: their stems are
+        found in one pass (through the lemmatizer machine if there is
+        one, or else by analyzing them), and the surface forms of all
+        their stems are then generated in one pass.
+        """
+        found, misses = self.lemmatizer_dict.get_many(forms)
+        results = dict(zip(misses, self._lemmatize_many(misses)))
+        self.lemmatizer_dict.set_many(results)
+        found.update(results)
+        return [found[form] for form in forms]
 
+    def _lemmatize_many(self, forms: list) -> list:
+        """
+        Finds the lemmas for each of a list of words, as described for
+        lemmatize.
+        """
         # for each possible parse, find all stem+category strings
-        stem_options = [re.findall(STEM_PAT, p) for p in parses]
-        unique_options = helpers.unique(stem_options)
+        options = [helpers.unique(stems) for stems in self._stem_options_many(forms)]
 
         # convert each stem string to a tuple of (surface forms, CAT)
-        results = []
-        for option in unique_options:
-            option = [self._analysis_to_lemma_tuple(stem) for stem in option]
-            if option and option not in results:
-                results.append(option)
+        stems = [stem for stem_options in options for o in stem_options for stem in o]
+        stem_forms = self._stem_forms(helpers.unique(stems))
+        return [self._lemmas(stem_options, stem_forms) for stem_options in options]
+
+    def _lemmas(self, stem_options: list, stem_forms: dict) -> list:
+        """
+        Returns the lemmatize result for the distinct stem tuples of a
+        word's analyses, given the surface forms of their stems.
+        """
+        results = {}
+        for option in stem_options:
+            option = tuple(
+                self._analysis_to_lemma_tuple(stem, stem_forms[stem]) for stem in option
+            )
+            if option:
+                results[option] = None
 
         if results:
-            return sorted(results)
+            return sorted(list(option) for option in results)
+
+    def unknown_symbols(self, query: str, inverse: bool = False) -> list:
+        """
+        Returns the sorted characters of a wordform (or with inverse,
+        of an analysis) that are outside the FST's alphabet, which
+        rule out any result: e.g. ["f", "q"]. Queries with any are
+        answered without a lookup.
+        """
+        if not inverse:
+            query = helpers.convert_to_underscore(query)
+        return sorted(self._reader.unknown_symbols(query, inverse))
 
     def analyze_properties(self, word: str, gloss_validator: str = None) -> dict:
         """
@@ -137,11 +462,18 @@ class Parser:
             - *valid_gloss_scored (analyses filtered by gloss_validator
                                     with their validation score,
                                     list of 2-tuples (str, num))
+            - *unknown_symbols (characters of the input outside the
+                                FST's alphabet, if any, which rule
+                                out any analysis: list of str)
         """
         result = {"input": word}
         output = self.analyze(word)
         result["output"] = output
 
+        unknown = self.unknown_symbols(word)
+        if unknown:
+            result["unknown_symbols"] = unknown
+
         if output:
             if gloss_validator:
                 res = ilg_helpers.filter_matching_glosses(output, gloss_validator)
@@ -165,6 +497,23 @@ class Parser:
 
         return result
 
+    def validate_corpus(self, pairs: list, workers: int = 1) -> list:
+        """
+        Input a list of (surface wordform, gloss validator) pairs, e.g.
+        the words of interlinear glossed stories. Returns a list of the
+        analyses of each word filtered and scored by its validator, in
+        the valid_gloss_scored format of analyze_properties, aligned
+        with the input.
+        The distinct words are looked up together in one pass, and each
+        distinct word and validator is scored once; with more than one
+        worker, scoring is spread over a process pool (workers None:
+        one per CPU).
+        """
+        words = [word for word, _ in pairs]
+        found = dict(zip(words, self.analyze_many(words)))
+        items = [(found[word], gloss) for word, gloss in pairs]
+        return ilg_helpers.validate_glosses(items, workers)
+
     def pairs(self) -> list:
         """
         Calls foma to run 'pairs', generating the last 100 listed pairs.
@@ -182,60 +531,273 @@ class Parser:
         result = self._reader.query("random-pairs")
         return self._reader.format_foma_pairs(result)
 
-    def random_unique_pairs(self, limit: int = 50) -> list:
+    def iter_pairs(self, limit: int = None, upper_filter=None, max_depth: int = None):
+        """
+        Yields every (analysis, surfaceform) pair of the compiled FST,
+        read from its binary file as they are needed, up to limit pairs
+        if given. A pair is yielded once for each path spelling it out.
+        upper_filter = keeps only the analyses containing this string
+                    (e.g. '+N'), or for which this function returns True
+        max_depth = the most arcs followed along a path; a cyclic FST
+                    has endless pairs, so needs one
+        Throws a ParserError if the pairs cannot be listed.
+        """
+        try:
+            pairs = self._reader.iter_pairs(max_depth)
+        except FomaError as e:
+            raise ParserError("Cannot list pairs: {}".format(e))
+
+        if isinstance(upper_filter, str):
+            pairs = (pair for pair in pairs if upper_filter in pair[0])
+        elif upper_filter is not None:
+            pairs = (pair for pair in pairs if upper_filter(pair[0]))
+        return itertools.islice(pairs, limit)
+
+    def write_pairs(
+        self,
+        path: str,
+        limit: int = None,
+        upper_filter=None,
+        max_depth: int = None,
+        output_format: str = "tsv",
+        chunk_size: int = 10000,
+    ) -> int:
+        """
+        Writes the pairs of iter_pairs (with the same options) to a
+        file, one per line as tab-separated analysis and surfaceform
+        ('tsv') or as a JSON list ('jsonl'), chunk_size lines at a
+        time. The file is gzipped if path ends with '.gz'.
+        Returns the number of pairs written.
         """
-        Calls foma to run 'random-pairs', and stores unique results
-        up to the limit specified. May take a while since only 100 items
-        can be queried at a time and foma may return duplicates.
-        Extended system usage prohibited by a timeout limit calculated
-        by the number of forms queried; throws a ParserError.
+        if output_format not in ("tsv", "jsonl"):
+            raise ParserError("Unknown output format: {}".format(output_format))
+        pairs = self.iter_pairs(limit, upper_filter, max_depth)
+        opener = gzip.open if path.endswith(".gz") else open
+
+        count = 0
+        with opener(path, "wt", encoding="utf-8") as f:
+            while True:
+                chunk = list(itertools.islice(pairs, chunk_size))
+                if not chunk:
+                    return count
+                if output_format == "tsv":
+                    lines = ["{}\t{}\n".format(*pair) for pair in chunk]
+                else:
+                    lines = [json.dumps(p, ensure_ascii=False) + "\n" for p in chunk]
+                f.writelines(lines)
+                count += len(chunk)
+
+    def random_unique_pairs(
+        self, limit: int = 50, tag: str = None, seed: int = None
+    ) -> list:
         """
-        if limit >= self._reader.paths:
+        Returns a list of limit distinct (analysis, surfaceform) pairs,
+        drawn uniformly at random from the paths of the compiled FST,
+        so a pair that several paths spell out is likelier to be drawn.
+        With tag (e.g. '+N' or '+VI'), pairs are drawn only from the
+        analyses with that tag. A seed makes the draw repeatable.
+        Throws a ParserError if fewer than limit pairs exist.
+        """
+        try:
+            result = self._reader.sample_pairs(limit, tag, seed)
+        except FomaError as e:
+            raise ParserError("Cannot sample pairs: {}".format(e))
+        if len(result) < limit:
             raise ParserError(
                 "{} random pairs requested, but {} available".format(
-                    limit, self._reader.paths
+                    limit, len(result)
                 )
             )
+        return result
 
-        sample_pairs = []
-        result = []
-        counter = 0
-        while len(result) < limit:
-            if not sample_pairs:
-                counter += 1
-                sample_pairs = self.random_pairs()
-            item = sample_pairs.pop()
-            if item not in result:
-                result.append(item)
-
-            if counter > (round(limit / 3) + 1):
-                raise ParserError(
-                    "Timeout: "
-                    + "{} unique random items could not be found.".format(limit)
-                )
+    def random_pairs_by_tag(self, limit: int, tags: list, seed: int = None) -> dict:
+        """
+        Draws random pairs as random_unique_pairs does, separately for
+        each tag. Returns a dictionary of each tag and its list of up
+        to limit (analysis, surfaceform) pairs, e.g.
+            {"+N": [("g$an+N", "g_an"), ...], "+VI": [...]}
+        """
+        result = {}
+        for number, tag in enumerate(tags):
+            tag_seed = None if seed is None else seed + number
+            try:
+                result[tag] = self._reader.sample_pairs(limit, tag, tag_seed)
+            except FomaError as e:
+                raise ParserError("Cannot sample pairs: {}".format(e))
+        return result
 
-        return list(result)
+    def _state_key(self, load_input: str or dict) -> tuple:
+        """
+        Returns the key under which shared parsers for this input and
+        these settings are registered: a hash of the config's inputs
+        (see FomaBuilder.input_hash), or the path of a foma file.
+        """
+        if type(load_input) is dict:
+            source = FomaBuilder(load_input).input_hash()
+        else:
+            source = os.path.abspath(load_input)
+        persistent_cache = self.persistent_cache
+        if persistent_cache:
+            persistent_cache = os.path.abspath(persistent_cache)
+        return (
+            source,
+            self.backend,
+            self.cache_size,
+            self.negative_cache_size,
+            persistent_cache,
+        )
+
+    @staticmethod
+    def _analyses_from_json(analyses: list) -> list:
+        """
+        Parses a list of analysis strings, as looked up or read back
+        from JSON, into Analysis objects.
+        """
+        return [parse_analysis(analysis) for analysis in analyses]
 
-    def _build(self, config: dict) -> tuple:
+    @staticmethod
+    def _lemmas_from_json(lemmas: list) -> list:
         """
-        Constructs a new foma file from configuration dictionary.
-        Returns a tuple of the new foma filepath and binary filepath.
+        Restores the (form, category) tuples of a lemmatize result
+        read back from JSON.
+        """
+        if lemmas is None:
+            return None
+        return [[tuple(lemma) for lemma in option] for option in lemmas]
+
+    def _build(self, config: dict) -> FomaReader:
+        """
+        Constructs a new foma file from configuration dictionary and
+        returns a FomaReader for it.
+        If the build manifest shows that the existing files were built
+        from identical inputs, they are loaded without recompiling.
         """
         builder = FomaBuilder(config)
+        foma_location = builder.foma_filepath()
+        bin_location = builder.fomabin_filepath()
+
+        if builder.is_current():
+            stats = builder.read_manifest()
+            return FomaReader(foma_location, bin_location, self.backend, stats)
+
         builder.build()
-        return (builder.foma_filepath(), builder.fomabin_filepath())
+        reader = FomaReader(foma_location, bin_location, self.backend)
+        if os.path.exists(bin_location):
+            builder.write_manifest(
+                {"states": reader.states, "arcs": reader.arcs, "paths": reader.paths}
+            )
+        return reader
+
+    def _stem_options(self, form: str) -> list:
+        """
+        Returns a list with a tuple of the stem+category strings of each
+        analysis of a word (as in Analysis.stems). With a lemmatizer machine,
+        these are found in a single lookup of the word.
+        """
+        return self._stem_options_many([form])[0]
+
+    def _stem_options_many(self, forms: list) -> list:
+        """
+        Returns the stem options (as for _stem_options) of each of a
+        list of words, aligned with the input, looking the words up
+        together in one pass.
+        """
+        self.warm()
+        lemmatizer = self._state.lemmatizer
+        if lemmatizer is None:
+            analyses = self.analyze_many(forms, structured=True)
+            return [[a.stems for a in result] for result in analyses]
+        queries = [helpers.convert_to_underscore(form) for form in forms]
+        # only the analyzer marks words as unanalyzable; this just reads
+        possible = [
+            query
+            for query in dict.fromkeys(queries)
+            if not self.negative_cache.check(query)
+        ]
+        found = dict(zip(possible, lemmatizer.lookup_many(possible)))
+        return [
+            [self._lemmatizer_stems(output) for output in found.get(query, [])]
+            for query in queries
+        ]
 
-    def _analysis_to_lemma_tuple(self, analysis_str: str) -> tuple:
+    @staticmethod
+    def _lemmatizer_stems(output: str) -> tuple:
+        """
+        Returns the stems of one lemmatizer output, which lists them
+        separated by spaces and closed by LEMMATIZER_END, as a tuple:
+            e.g. "sim+MDF w$an+N #" -> ("sim+MDF", "w$an+N"); "#" -> ()
+        """
+        stems = output[: -len(LEMMATIZER_END)].split()
+        return tuple(sys.intern(stem) for stem in stems)
+
+    def _lemmatizer(self, config: dict) -> FomaReader:
+        """
+        Returns a FomaReader for the lemmatizer machine built with the
+        parser, if the config asks for one and it was built. It is only
+        used for lookups in its binary file, whose figures are read from
+        the file's header, so the foma file is never compiled for it.
+        """
+        builder = FomaBuilder(config)
+        bin_file = builder.lemmatizer_filepath()
+        if not config.get("lemmatizer") or not os.path.exists(bin_file):
+            return None
+        try:
+            stats = read_props(bin_file)
+        except FomaBinError as e:
+            raise ParserError("Cannot load the lemmatizer: {}".format(e))
+        return FomaReader(builder.foma_filepath(), bin_file, self.backend, stats)
+
+    def _lemma_table(self, config: dict, reader: FomaReader) -> dict:
+        """
+        Returns the surface forms of every Lexicon stem (see
+        FomaBuilder.lemma_stems), loaded if saved for the same inputs,
+        or else generated in one pass and saved alongside the build.
+        """
+        builder = FomaBuilder(config)
+        lemmas = builder.read_lemmas()
+        if lemmas is None:
+            stems = builder.lemma_stems()
+            results = reader.lookup_many(stems, inverse=True)
+            lemmas = {
+                stem: [helpers.convert_to_macron(item) for item in result]
+                for stem, result in zip(stems, results)
+            }
+            builder.write_lemmas(lemmas)
+        return lemmas
+
+    def _stem_forms(self, stems: list) -> dict:
+        """
+        Returns a dict of the generated surface forms of each stem
+        analysis. Stems are read from the lemma table of the build if
+        they are in it; any others are generated together in one pass.
+        The lemma table is made the first time it is needed.
+        """
+        self.warm()
+        state = self._state
+        with state.lock:
+            if state.lemmas is None:
+                if type(state.load_input) is dict:
+                    state.lemmas = self._lemma_table(state.load_input, state.reader)
+                else:
+                    state.lemmas = {}
+            lemmas = state.lemmas
+        forms = {stem: lemmas[stem] for stem in stems if stem in lemmas}
+        misses = [stem for stem in stems if stem not in forms]
+        forms.update(zip(misses, self.generate_many(misses)))
+        return forms
+
+    def _analysis_to_lemma_tuple(self, analysis_str: str, forms: list = None) -> tuple:
         """
         Takes a string corresponding to a single stem generated from
         the FST parser ('upper' form). Outputs a 2-tuple consisting of:
             - the generated form (with variants separated by slashes)
             - the category abbreviation for that form
             e.g. 'cat+N' -> ('cat/Cat', 'N')
+        The generated forms are looked up unless given.
         """
-        forms = self.generate(analysis_str)
-        pat = r"\+([A-Z]+)"  # finds partofspeech abbreviation
-        abbrev = re.search(pat, analysis_str).group(1)
+        if forms is None:
+            forms = self._stem_forms([analysis_str])[analysis_str]
+        abbrev = parse_analysis(analysis_str).pos[0]
         if forms and abbrev:
             surface_forms = "/".join(sorted(helpers.unique(forms)))
             return (surface_forms, abbrev)
@@ -245,3 +807,57 @@ class Parser:
             else:
                 surface_forms = "-ust"
             return (surface_forms, abbrev)
+
+
+class _ParserState:
+    """
+    The input, loaded reader and result caches behind a Parser.
+    Shared parsers for the same input and settings share one state,
+    counting the parsers that use it in refs.
+    """
+
+    def __init__(self, load_input: str or dict, parser: Parser) -> None:
+        self.load_input = load_input
+        self.reader = None
+        self.lock = threading.Lock()
+        self.refs = 0
+        self.lemmas = None
+        self.lemmatizer = None
+        self.store = None
+
+        self.analyzer_dict = LRUCache(
+            parser.cache_size, kind="analyze", decode=parser._analyses_from_json
+        )
+        self.negative_cache = NegativeCache(parser.negative_cache_size)
+        self.generator_dict = LRUCache(parser.cache_size, kind="generate")
+        self.lemmatizer_dict = LRUCache(
+            parser.cache_size, kind="lemmatize", decode=parser._lemmas_from_json
+        )
+
+    def close(self) -> None:
+        if self.reader is not None:
+            self.reader.close()
+        if self.lemmatizer is not None:
+            self.lemmatizer.close()
+        if self.store is not None:
+            self.store.close()
+
+
+_shared_states = {}
+_shared_lock = threading.Lock()
+
+
+def _release_state(key: tuple, state: _ParserState) -> None:
+    """
+    Called when a parser is closed, reloaded or collected. Closes its
+    state, or for a shared state, drops the parser's reference to it
+    and closes it once no parser is left.
+    """
+    if key is not None:
+        with _shared_lock:
+            state.refs -= 1
+            if state.refs > 0:
+                return
+            if _shared_states.get(key) is state:
+                del _shared_states[key]
+    state.close()
@@ -0,0 +1,109 @@
+import collections
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .parser import Parser, FULL_EW
+
+"""
+Runs a parser over a corpus of words in parallel. The corpus is split
+into chunks, which are looked up in a pool of worker processes, each
+with its own parser, and the results are merged back in input order.
+    for row in run_corpus(open("words.txt"), BASIC_E, workers=4):
+        row  # {"input": "gat", "analyze": [...], "ilg": [...], ...}
+"""
+
+TASKS = ("analyze", "ilg", "lemmatize")
+
+
+def run_task(parser: Parser, task: str, words: list) -> list:
+    """
+    Runs one task over a chunk of words: analyze, generate, ilg
+    (analyze_to_ilg) or lemmatize. Returns a list of result lists
+    aligned with the input; words without results get an empty list.
+    """
+    if task == "analyze":
+        return parser.analyze_many(words)
+    if task == "generate":
+        return parser.generate_many(words)
+    if task == "lemmatize":
+        return [result or [] for result in parser.lemmatize_many(words)]
+    if task != "ilg":
+        raise ValueError("Unknown task: {}".format(task))
+
+    # look the words up in one pass before converting them one by one
+    parser.analyze_many(words)
+    return [parser.analyze_to_ilg(word) for word in words]
+
+
+def run_chunk(parser: Parser, tasks: tuple, words: list) -> list:
+    """
+    Runs each task over a chunk of words. Returns a list with a dict
+    for each word, holding the word as "input" and the results of
+    each task under its name.
+    """
+    rows = [{"input": word} for word in words]
+    for task in tasks:
+        for row, results in zip(rows, run_task(parser, task, words)):
+            row[task] = results
+    return rows
+
+
+_worker_parser = None
+
+
+def _init_worker(load_input: str or dict, cache_size: int) -> None:
+    global _worker_parser
+    _worker_parser = Parser(
+        load_input, cache_size=cache_size, negative_cache_size=cache_size
+    )
+
+
+def _run_worker_chunk(tasks: tuple, words: list) -> list:
+    return run_chunk(_worker_parser, tasks, words)
+
+
+def run_corpus(
+    lines,
+    load_input: str or dict = FULL_EW,
+    tasks: tuple = TASKS,
+    chunk_size: int = 1000,
+    workers: int = None,
+    cache_size: int = None,
+):
+    """
+    Looks up each line of an iterable of lines (such as an open file)
+    as one word, in chunks of chunk_size lines. Yields a dict per line,
+    in input order, as for run_chunk.
+    Chunks are run in a pool of worker processes (default: one per
+    CPU), each of which builds its parser once; the FST is built
+    beforehand, so that the workers load the compiled binary. At most
+    two chunks per worker are read ahead of the output, so memory use
+    stays bounded. With one worker, everything runs in this process.
+    cache_size bounds the result caches of each parser.
+    """
+    words = (line.strip() for line in lines)
+    chunks = iter(lambda: list(itertools.islice(words, chunk_size)), [])
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        parser = Parser(
+            load_input, cache_size=cache_size, negative_cache_size=cache_size
+        )
+        for chunk in chunks:
+            yield from run_chunk(parser, tasks, chunk)
+        return
+
+    Parser(load_input, lazy=True).warm()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(load_input, cache_size),
+    ) as pool:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_run_worker_chunk, tasks, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        for future in pending:
+            yield from future.result()
@@ -0,0 +1,50 @@
+import unittest
+
+from src.analysis import Analysis, parse_analysis
+
+"""
+Tests the parsing of FST analysis strings into Analysis objects.
+"""
+
+
+class TestAnalysis(unittest.TestCase):
+
+    def test_parts(self):
+        result = parse_analysis("'nii+PVB-g$at+VI[-3.II]=CN")
+        self.assertEqual(result.stems, ("'nii+PVB", "g$at+VI"))
+        self.assertEqual(result.pos, ("PVB", "VI"))
+        self.assertEqual(result.affixes, ("3.II",))
+        self.assertEqual(result.clitics, ("CN",))
+
+    def test_plain_stem(self):
+        result = parse_analysis("gwil$a+N")
+        self.assertEqual(result.stems, ("gwil$a+N",))
+        self.assertEqual((result.affixes, result.clitics), ((), ()))
+
+    def test_no_stem(self):
+        result = parse_analysis("")
+        self.assertEqual((result.stems, result.pos), ((), ()))
+
+    def test_compares_as_string(self):
+        result = parse_analysis("w$an+N-T")
+        self.assertEqual(result, "w$an+N-T")
+        self.assertEqual(result, Analysis("w$an+N-T"))
+        self.assertEqual(hash(result), hash("w$an+N-T"))
+        self.assertIn("w$an+N-T", {result})
+        self.assertEqual(str(result), "w$an+N-T")
+
+    def test_sorts_as_string(self):
+        result = sorted([parse_analysis("w$an+VI"), parse_analysis("w$an+N")])
+        self.assertEqual(result, ["w$an+N", "w$an+VI"])
+
+    def test_slots(self):
+        self.assertFalse(hasattr(parse_analysis("w$an+N"), "__dict__"))
+
+    def test_tags_interned(self):
+        first = Analysis("w$an+N-T").pos[0]
+        second = Analysis("gwil$a+N").pos[0]
+        self.assertIs(first, second)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+
+from test import FIX_DIR, TestFSTOutput, BASIC_E
+from src.async_parser import AsyncFlookupProcess, AsyncParser
+from src.parser import Parser
+
+"""
+This suite tests the asyncio lookup interface. The flookup tests
+depend on the sample bin file; the parser tests build a parser
+end-to-end as in test_parser.
+"""
+
+
+class TestAsyncFlookup(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.flookup = AsyncFlookupProcess(FIX_DIR + '/test.fomabin')
+
+    async def asyncTearDown(self):
+        await self.flookup.close()
+
+    async def test_lookup(self):
+        self.assertEqual(await self.flookup.lookup('dog'), 'cog')
+        self.assertEqual(await self.flookup.lookup('xxx'), '+?')
+
+    async def test_inverse_lookup(self):
+        flookup = AsyncFlookupProcess(FIX_DIR + '/test.fomabin', inverse=True)
+        try:
+            self.assertEqual(await flookup.lookup('cog'), 'dog')
+        finally:
+            await flookup.close()
+
+    async def test_lookup_many(self):
+        result = await self.flookup.lookup_many(['dog', 'xxx', 'dog'])
+        self.assertEqual(result, ['cog', '+?', 'cog'])
+
+    async def test_lookup_reuses_process(self):
+        await self.flookup.lookup('dog')
+        process = self.flookup._process
+        await self.flookup.lookup('dog')
+        self.assertIs(self.flookup._process, process)
+
+    async def test_lookup_restarts_process(self):
+        await self.flookup.lookup('dog')
+        process = self.flookup._process
+        process.kill()
+        await process.wait()
+        self.assertEqual(await self.flookup.lookup('dog'), 'cog')
+        self.assertIsNot(self.flookup._process, process)
+
+    async def test_cancelled_lookup(self):
+        task = asyncio.ensure_future(self.flookup.lookup_many(['dog'] * 10000))
+        await asyncio.sleep(0)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(await self.flookup.lookup('dog'), 'cog')
+
+    async def test_concurrent_lookups(self):
+        results = await asyncio.gather(
+            *(self.flookup.lookup(word) for word in ['dog', 'xxx'] * 50))
+        self.assertEqual(results, ['cog', '+?'] * 50)
+
+
+class TestAsyncParser(TestFSTOutput):
+
+    @classmethod
+    def setUpClass(cls):
+        test_stems = {
+            "Noun": ["g_$an", "gwil$a"],
+        }
+        super().setUpClass(BASIC_E, test_stems)
+
+    def run_async(self, coroutine_function):
+        async def run():
+            fst = AsyncParser(self.fst)
+            try:
+                return await coroutine_function(fst)
+            finally:
+                await fst.close()
+        return asyncio.run(run())
+
+    def test_analyze(self):
+        result = self.run_async(lambda fst: fst.analyze("gwila"))
+        self.assertIn("gwil$a+N", result)
+
+    def test_analyzeMany(self):
+        result = self.run_async(
+            lambda fst: fst.analyze_many(["g̱an", "xxx", "gwila"]))
+        self.assertEqual(result, self.fst.analyze_many(["g̱an", "xxx", "gwila"]))
+
+    def test_sharesCache(self):
+        self.run_async(lambda fst: fst.analyze("gwila"))
+        self.assertIn("gwila", self.fst.analyzer_dict)
+
+    def test_generate(self):
+        result = self.run_async(lambda fst: fst.generate("gwil$a+N"))
+        self.assertEqual(result, self.fst.generate("gwil$a+N"))
+
+    def test_warmsOnEnter(self):
+        parser = Parser(self.config, lazy=True)
+
+        async def enter():
+            async with AsyncParser(parser):
+                return parser.loaded
+
+        self.assertTrue(asyncio.run(enter()))
+        parser.close()
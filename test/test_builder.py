@@ -57,4 +57,158 @@ class TestBuilder(unittest.TestCase):
         expected = os.path.abspath(os.path.join(FIX_DIR, 'foma/test.foma'))
         self.assertEqual(actual, expected)
         
-    # tests for lexc/morphological description builder
\ No newline at end of file
+    def test_output_dir(self):
+        self.config['output_dir'] = 'foma/isolated'
+        actual = FomaBuilder(self.config).foma_filepath()
+        expected = os.path.abspath(
+            os.path.join(FIX_DIR, 'foma/isolated/test.foma'))
+        self.assertEqual(actual, expected)
+
+    def test_manifest_path(self):
+        actual = FomaBuilder(self.config).manifest_filepath()
+        expected = os.path.abspath(
+            os.path.join(FIX_DIR, 'foma/test.manifest.json'))
+        self.assertEqual(actual, expected)
+
+    def test_lemmatizer_path(self):
+        actual = FomaBuilder(self.config).lemmatizer_filepath()
+        expected = os.path.abspath(
+            os.path.join(FIX_DIR, 'foma/test.lemmatizer.fomabin'))
+        self.assertEqual(actual, expected)
+
+    def test_lemmatizer(self):
+        path = os.path.abspath(os.path.join(FIX_DIR, 'foma'))
+        try:
+            builder = FomaBuilder(self.config)
+            builder.build()
+            with open(builder.foma_filepath()) as f:
+                self.assertNotIn("lemmatizer", f.read())
+
+            self.config['lemmatizer'] = True
+            builder = FomaBuilder(self.config)
+            builder.build()
+            with open(builder.foma_filepath()) as f:
+                content = f.read()
+            lemmatizer = content.index(
+                "save stack " + builder.lemmatizer_filepath())
+            self.assertIn('[ "-T" .x. "-" "T" ]', content)
+            self.assertIn('define LemmaTag %+ [ "N" | "P" ]+ ;', content)
+            self.assertIn('0:"#" ] ;', content)
+            # the parser is put back and saved last, as without one
+            parser = content.index("regex Grammar ;", lemmatizer)
+            self.assertTrue(content.endswith(
+                "save stack " + builder.fomabin_filepath()))
+            self.assertLess(parser, content.rindex("save stack"))
+        finally:
+            shutil.rmtree(path)
+
+    def test_input_hash_stable(self):
+        first = FomaBuilder(self.config).input_hash()
+        second = FomaBuilder(dict(self.config)).input_hash()
+        self.assertEqual(first, second)
+
+    def test_input_hash_dictionary_change(self):
+        first = FomaBuilder(self.config).input_hash()
+        self.config['dictionary'] = {'Noun': ["test", "other"]}
+        second = FomaBuilder(self.config).input_hash()
+        self.assertNotEqual(first, second)
+
+    def test_manifest(self):
+        path = os.path.abspath(os.path.join(FIX_DIR, 'foma'))
+        try:
+            builder = FomaBuilder(self.config)
+            self.assertFalse(builder.is_current())
+            self.assertIsNone(builder.read_manifest())
+
+            builder.build()
+            # stands in for the binary foma would write
+            shutil.copy(os.path.join(FIX_DIR, 'test.fomabin'),
+                        builder.fomabin_filepath())
+            builder.write_manifest({"states": 4, "arcs": 3, "paths": 1})
+
+            manifest = FomaBuilder(self.config).read_manifest()
+            self.assertEqual(manifest["states"], 4)
+            self.assertTrue(FomaBuilder(self.config).is_current())
+
+            self.config['lemmatizer'] = True
+            self.assertFalse(FomaBuilder(self.config).is_current())
+            self.config['dictionary'] = {'Noun': ["other"]}
+            self.assertFalse(FomaBuilder(self.config).is_current())
+        finally:
+            shutil.rmtree(path)
+
+    def test_definitions_split(self):
+        builder = FomaBuilder(self.config)
+        builder._build_rules()
+
+        self.assertIn("define BigTDoubling", builder._definitions)
+        self.assertNotIn("regex Lexicon", builder._definitions)
+        self.assertNotIn("define BigTDoubling", builder._rules)
+        self.assertTrue(builder._rules.startswith("regex Lexicon ;"))
+
+    def test_current_needs_definitions(self):
+        path = os.path.abspath(os.path.join(FIX_DIR, 'foma'))
+        try:
+            builder = FomaBuilder(self.config)
+            os.makedirs(builder.output_dir())
+            cache = os.path.join(builder.output_dir(), 'rules-test.defined')
+            with open(builder.foma_filepath(), 'w') as f:
+                f.write("load defined {}\n".format(cache))
+            open(builder.fomabin_filepath(), 'w').close()
+            builder.write_manifest({})
+            self.assertFalse(builder.is_current())
+
+            open(cache, 'w').close()
+            self.assertTrue(builder.is_current())
+        finally:
+            shutil.rmtree(path)
+
+    def test_definitions_cache(self):
+        path = os.path.abspath(os.path.join(FIX_DIR, 'foma'))
+        try:
+            builder = FomaBuilder(self.config)
+            builder.build()
+            cache = builder.definitions_filepath()
+            with open(builder.foma_filepath()) as f:
+                self.assertIn("save defined " + cache, f.read())
+
+            # same rules in another config share the cache
+            self.config['name'] = 'other'
+            self.config['dialect_variation'] = True
+            other = FomaBuilder(self.config)
+            other._build_rules()
+            self.assertEqual(other.definitions_filepath(), cache)
+
+            open(cache, 'w').close()
+            other.build()
+            with open(other.foma_filepath()) as f:
+                content = f.read()
+            self.assertIn("load defined " + cache, content)
+            self.assertNotIn("define BigTDoubling", content)
+        finally:
+            shutil.rmtree(path)
+
+    def test_lemma_stems(self):
+        self.config['dictionary'] = {'Noun': ["test", "ha(t)", "$am"]}
+        actual = FomaBuilder(self.config).lemma_stems()
+        self.assertEqual(actual, ["test+N", "haT+N", "'$am+N"])
+
+    def test_lemmas(self):
+        path = os.path.abspath(os.path.join(FIX_DIR, 'foma'))
+        try:
+            builder = FomaBuilder(self.config)
+            self.assertIsNone(builder.read_lemmas())
+            os.makedirs(builder.output_dir())
+            builder.write_lemmas({"test+N": ["test"]})
+            self.assertEqual(FomaBuilder(self.config).read_lemmas(),
+                             {"test+N": ["test"]})
+            self.assertEqual(os.listdir(builder.output_dir()),
+                             [os.path.basename(builder.lemmas_filepath())])
+
+            # made from other inputs
+            self.config['dictionary'] = {'Noun': ["other"]}
+            self.assertIsNone(FomaBuilder(self.config).read_lemmas())
+        finally:
+            shutil.rmtree(path)
+
+    # tests for lexc/morphological description builder
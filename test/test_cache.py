@@ -0,0 +1,216 @@
+import unittest
+import os, shutil, tempfile, threading
+
+from test import FIX_DIR
+from src.cache import DiskCache, LRUCache, NegativeCache
+
+"""
+This suite tests the bounded result cache used by the parser and
+its persistent store. The sample bin files stand in for builds.
+"""
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_store(self):
+        cache = LRUCache()
+        cache['a'] = [1]
+        self.assertIn('a', cache)
+        self.assertEqual(cache['a'], [1])
+        self.assertEqual(len(cache), 1)
+
+    def test_unbounded(self):
+        cache = LRUCache()
+        for i in range(1000):
+            cache[i] = i
+        self.assertEqual(len(cache), 1000)
+        self.assertEqual(cache.evictions, 0)
+
+    def test_evicts_least_recent(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache['c'] = 3
+        self.assertEqual(list(cache), ['a', 'c'])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_zero_size(self):
+        cache = LRUCache(0)
+        cache['a'] = 1
+        self.assertEqual(len(cache), 0)
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            LRUCache(-1)
+
+    def test_get_counts(self):
+        cache = LRUCache()
+        cache['a'] = 1
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_get_many(self):
+        cache = LRUCache()
+        cache['a'] = 1
+        found, missing = cache.get_many(['b', 'a', 'c', 'b'])
+        self.assertEqual(found, {'a': 1})
+        self.assertEqual(missing, ['b', 'c'])
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 2)
+
+    def test_get_many_survives_eviction(self):
+        cache = LRUCache(1)
+        cache['a'] = 1
+        found, missing = cache.get_many(['a', 'b'])
+        cache['b'] = 2
+        self.assertNotIn('a', cache)
+        self.assertEqual(found['a'], 1)
+
+    def test_stats(self):
+        cache = LRUCache(1)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('b')
+        expected = {
+            "size": 1, "maxsize": 1, "hits": 1, "misses": 0, "evictions": 1
+        }
+        self.assertEqual(cache.stats(), expected)
+
+    def test_mapping_methods(self):
+        cache = LRUCache(2)
+        cache.update({'a': 1, 'b': 2})
+        self.assertEqual(list(cache.items()), [('a', 1), ('b', 2)])
+        self.assertEqual(list(cache.values()), [1, 2])
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertEqual(list(cache.keys()), ['b'])
+        self.assertEqual(cache.setdefault('c', 3), 3)
+        self.assertEqual(dict(cache), {'b': 2, 'c': 3})
+
+
+class TestNegativeCache(unittest.TestCase):
+
+    def test_check(self):
+        cache = NegativeCache()
+        self.assertFalse(cache.check('xxx'))
+        cache.add('xxx')
+        self.assertTrue(cache.check('xxx'))
+        self.assertEqual(cache.hits, 1)
+
+    def test_evicts_least_recent(self):
+        cache = NegativeCache(2)
+        cache.add('a')
+        cache.add('b')
+        cache.check('a')
+        cache.add('c')
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_stats(self):
+        cache = NegativeCache(10)
+        empty = cache.stats()['memory']
+        cache.add('xxx')
+        stats = cache.stats()
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['false_positive_rate'], 0)
+        self.assertGreater(stats['memory'], empty)
+
+    def test_clear(self):
+        cache = NegativeCache()
+        cache.add('xxx')
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache.sqlite')
+        self.build = os.path.join(self.dir, 'test.fomabin')
+        shutil.copy(FIX_DIR + '/test.fomabin', self.build)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_persists(self):
+        cache = DiskCache(self.path, self.build)
+        cache.set('analyze', 'dog', ['cog'])
+        cache.close()
+
+        cache = DiskCache(self.path, self.build)
+        found = cache.get_many('analyze', ['dog', 'xxx'])
+        self.assertEqual(found, {'dog': ['cog']})
+        self.assertEqual(cache.get_many('generate', ['dog']), {})
+        cache.close()
+
+    def test_rebuild_invalidates(self):
+        cache = DiskCache(self.path, self.build)
+        cache.set('analyze', 'dog', ['cog'])
+        cache.close()
+
+        shutil.copy(FIX_DIR + '/test_flags.fomabin', self.build)
+        cache = DiskCache(self.path, self.build)
+        self.assertEqual(cache.get_many('analyze', ['dog']), {})
+        cache.close()
+
+    def test_other_builds_kept(self):
+        other = os.path.join(self.dir, 'other.fomabin')
+        shutil.copy(FIX_DIR + '/test_flags.fomabin', other)
+        cache = DiskCache(self.path, self.build)
+        cache.set('analyze', 'dog', ['cog'])
+        cache.close()
+
+        DiskCache(self.path, other).close()
+        cache = DiskCache(self.path, self.build)
+        self.assertEqual(cache.get_many('analyze', ['dog']), {'dog': ['cog']})
+        cache.close()
+
+    def test_other_thread(self):
+        cache = DiskCache(self.path, self.build)
+        found = []
+        worker = threading.Thread(target=lambda: (
+            cache.set('analyze', 'dog', ['cog']),
+            found.append(cache.get_many('analyze', ['dog']))))
+        worker.start()
+        worker.join()
+        self.assertEqual(found, [{'dog': ['cog']}])
+        cache.close()
+
+    def test_reopens_after_close(self):
+        cache = DiskCache(self.path, self.build)
+        cache.set('analyze', 'dog', ['cog'])
+        cache.close()
+        self.assertEqual(cache.get_many('analyze', ['dog']), {'dog': ['cog']})
+        cache.close()
+
+    def test_set_many(self):
+        cache = DiskCache(self.path, self.build)
+        cache.set_many('analyze', {'dog': ['cog'], 'xxx': []})
+        found = cache.get_many('analyze', ['dog', 'xxx'])
+        self.assertEqual(found, {'dog': ['cog'], 'xxx': []})
+        cache.close()
+
+    def test_lru_cache_set_many(self):
+        store = DiskCache(self.path, self.build)
+        cache = LRUCache(store=store, kind='analyze')
+        cache.set_many({'dog': ['cog']})
+        cache.persist_many({'xxx': []})
+        self.assertEqual(dict(cache), {'dog': ['cog']})
+        self.assertEqual(store.get_many('analyze', ['dog', 'xxx']),
+                         {'dog': ['cog'], 'xxx': []})
+        store.close()
+
+    def test_backs_lru_cache(self):
+        store = DiskCache(self.path, self.build)
+        cache = LRUCache(store=store, kind='lemmatize', decode=tuple)
+        cache['dog'] = ('cog', 'N')
+
+        cache = LRUCache(store=store, kind='lemmatize', decode=tuple)
+        self.assertEqual(cache.get('dog'), ('cog', 'N'))
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+        self.assertEqual(cache.stats()['hits'], 0)
+        store.close()
@@ -0,0 +1,158 @@
+import random
+import unittest
+
+from test import FIX_DIR
+from src.fomabin import FomaBinary, FomaBinError, read_alphabets, read_props
+from src.foma_reader import FomaReader
+
+"""
+This suite tests the pure-Python reader for foma binary files.
+Dependencies are the compiled test.fomabin and test_flags.fomabin
+fixtures; foma itself is not needed.
+test_flags.fomabin was compiled from the regex:
+    [ "@P.VAL.BIGT@" b a t | w a n ] "+N":0
+        [ 0 | "@D.VAL.BIGT@" "-SX":i 0:t | "-3.II":t ]
+    | "@P.CAT.AUX@" "@R.CAT.AUX@" n e e "+AUX":0
+test_cyclic.fomabin was compiled from the regex:
+    b [a:o]* "+PL":z
+"""
+
+
+class TestFomaBinary(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fst = FomaBinary(FIX_DIR + '/test.fomabin')
+        cls.flags = FomaBinary(FIX_DIR + '/test_flags.fomabin')
+        cls.cyclic = FomaBinary(FIX_DIR + '/test_cyclic.fomabin')
+
+    def test_loads(self):
+        self.assertEqual(self.fst.states, 4)
+        self.assertEqual(self.fst.arcs, 3)
+        self.assertEqual(self.fst.count_paths(), 1)
+
+    def test_not_binary(self):
+        with self.assertRaises(FomaBinError):
+            FomaBinary(FIX_DIR + '/test.foma')
+
+    def test_apply_up(self):
+        self.assertEqual(self.fst.apply_up('dog'), ['cog'])
+        self.assertEqual(self.fst.apply_up('cog'), [])
+
+    def test_apply_down(self):
+        self.assertEqual(self.fst.apply_down('cog'), ['dog'])
+        self.assertEqual(self.fst.apply_down('dog'), [])
+
+    def test_apply_empty(self):
+        self.assertEqual(self.fst.apply_up(''), [])
+
+    def test_multichar_symbols(self):
+        self.assertEqual(self.flags.apply_up('batt'), ['bat+N-3.II'])
+        self.assertEqual(self.flags.apply_down('bat+N-3.II'), ['batt'])
+
+    def test_epsilon_output(self):
+        self.assertEqual(self.flags.apply_up('wanit'), ['wan+N-SX'])
+        self.assertEqual(self.flags.apply_down('wan+N-SX'), ['wanit'])
+
+    def test_flag_disallow(self):
+        self.assertEqual(self.flags.apply_up('bat'), ['bat+N'])
+        self.assertEqual(self.flags.apply_up('batit'), [])
+        self.assertEqual(self.flags.apply_down('bat+N-SX'), [])
+
+    def test_flag_require(self):
+        self.assertEqual(self.flags.apply_up('nee'), ['nee+AUX'])
+
+    def test_unknown_symbols(self):
+        self.assertEqual(self.flags.apply_up('wanq'), [])
+        self.assertEqual(self.flags.apply_up('@P.VAL.BIGT@'), [])
+
+    def test_alphabet(self):
+        self.assertEqual(self.fst.alphabet(), frozenset('dog'))
+        self.assertEqual(self.fst.alphabet(inverse=True), frozenset('cog'))
+        self.assertNotIn('@', self.flags.alphabet())
+        self.assertIn('+', self.flags.alphabet(inverse=True))
+
+    def test_count_paths(self):
+        self.assertEqual(self.flags.count_paths(), 7)
+
+    def test_iter_pairs(self):
+        self.assertEqual(list(self.fst.iter_pairs()), [('cog', 'dog')])
+        result = list(self.flags.iter_pairs())
+        self.assertEqual(len(result), 6)
+        self.assertEqual(result[0], ('bat+N', 'bat'))
+        self.assertNotIn(('bat+N-SX', 'batit'), result)
+
+    def test_iter_pairs_depth(self):
+        self.assertEqual(self.cyclic.count_paths(), -1)
+        result = list(self.cyclic.iter_pairs(max_depth=3))
+        self.assertEqual(result, [('ba+PL', 'boz'), ('b+PL', 'bz')])
+
+    def test_sample_pairs(self):
+        result = self.flags.sample_pairs(100)
+        self.assertEqual(len(result), 6)  # one of the 7 paths is blocked
+        self.assertIn(('wan+N-SX', 'wanit'), result)
+        self.assertNotIn(('bat+N-SX', 'batit'), result)
+
+    def test_sample_pairs_count(self):
+        result = self.flags.sample_pairs(3)
+        self.assertEqual(len(set(result)), 3)
+
+    def test_sample_pairs_tag(self):
+        self.assertEqual(self.flags.sample_pairs(10, '+AUX'), [('nee+AUX', 'nee')])
+        self.assertEqual(len(self.flags.sample_pairs(10, '+N')), 5)
+        self.assertEqual(self.flags.sample_pairs(10, 'lalala'), [])
+
+    def test_sample_pairs_seed(self):
+        first = self.flags.sample_pairs(3, rng=random.Random(4))
+        self.assertEqual(self.flags.sample_pairs(3, rng=random.Random(4)), first)
+
+    def test_sample_pairs_uniform(self):
+        rng = random.Random(0)
+        counts = {}
+        for _ in range(6000):
+            pair = self.flags.sample_pairs(1, rng=rng)[0]
+            counts[pair] = counts.get(pair, 0) + 1
+        self.assertEqual(len(counts), 6)
+        for count in counts.values():
+            self.assertTrue(800 < count < 1200)
+
+    def test_read_alphabets(self):
+        for fst, name in [(self.fst, 'test'), (self.flags, 'test_flags')]:
+            alphabets = read_alphabets(FIX_DIR + '/' + name + '.fomabin')
+            self.assertEqual(alphabets, {False: fst.alphabet(False),
+                                         True: fst.alphabet(True)})
+
+    def test_read_props(self):
+        props = read_props(FIX_DIR + '/test.fomabin')
+        self.assertEqual(props, {'states': self.fst.states,
+                                 'arcs': self.fst.arcs,
+                                 'paths': self.fst.paths})
+
+    def test_read_alphabets_bad_file(self):
+        with self.assertRaises(FomaBinError):
+            read_alphabets(FIX_DIR + '/test.foma')
+
+
+class TestPythonBackend(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        path = FIX_DIR + '/test.foma'
+        binpath = FIX_DIR + '/test.fomabin'
+        cls.reader = FomaReader(path, binpath, backend='python')
+
+    def test_lookup(self):
+        self.assertEqual(self.reader.lookup('dog'), ['cog'])
+        self.assertEqual(self.reader.lookup('xxx'), [])
+
+    def test_inverse_lookup(self):
+        self.assertEqual(self.reader.lookup('cog', inverse=True), ['dog'])
+
+    def test_alphabets(self):
+        self.assertEqual(self.reader.unknown_symbols('dxg'), {'x'})
+        # both directions come from the one load of the binary
+        self.assertEqual(self.reader._alphabets[True], frozenset('cog'))
+
+    def test_lookup_many(self):
+        result = self.reader.lookup_many(['dog', 'xxx', 'dog'])
+        self.assertEqual(result, [['cog'], [], ['cog']])
@@ -130,5 +130,39 @@ class TestStressMarking (unittest.TestCase):
 
         self.assertEqual(['ab$a'], result)
 
+
+class TestTokenize (unittest.TestCase):
+
+    def test_tokenize_offsets(self):
+        result = helpers.tokenize('Gat, wan.')
+        self.assertEqual([('Gat', 0, 3), ('wan', 5, 8)], result)
+
+    def test_tokenize_apostrophes(self):
+        result = helpers.tokenize("'wii'ame k’ap")
+        self.assertEqual(["'wii'ame", 'k’ap'], [tok for tok, _, _ in result])
+
+    def test_tokenize_joined(self):
+        result = helpers.tokenize('needii=hl k_ap-gat - 12')
+        self.assertEqual(['needii=hl', 'k_ap-gat'], [tok for tok, _, _ in result])
+
+    def test_tokenize_underline(self):
+        result = helpers.tokenize('g̱an g̲an')
+        self.assertEqual(['g̱an', 'g̲an'], [tok for tok, _, _ in result])
+
+    def test_token_to_query(self):
+        self.assertEqual("neediihl", helpers.token_to_query('Needii=hl'))
+        self.assertEqual("k'ag_a", helpers.token_to_query('K’ag̱a'))
+
+
+class TestUnique (unittest.TestCase):
+
+    def test_unique_hashable(self):
+        result = helpers.unique(['b', 'a', 'b', 'c', 'a'])
+        self.assertEqual(['b', 'a', 'c'], result)
+
+    def test_unique_unhashable(self):
+        result = helpers.unique([['b'], ['a'], ['b']])
+        self.assertEqual([['b'], ['a']], result)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,8 @@
+import random
+import re
 import unittest
 
-from src import ilg_helpers
+from src import ilg_helpers, STEM_PAT
 from src.parser import Parser
 
 """
@@ -53,6 +55,48 @@ class TestFSTtoStoryGloss(unittest.TestCase):
         fst_ver, expected = ('3PL+QUOT-3PL.INDP', '3.I=QUOT.3PL-3PL.INDP')
         self.assertEqual(self.convert(fst_ver), expected)
 
+class TestStoryGlossConversion(unittest.TestCase):
+    """
+    Compares fst_to_story_gloss with the original step-by-step
+    conversion, on random glosses made up of FST morphemes, with and
+    without morpheme boundaries between them.
+    """
+
+    def convert(self, fst_ver):
+        return ilg_helpers.fst_to_story_gloss(fst_ver)
+
+    def stepwise(self, fst_gloss):
+        new_gloss = fst_gloss
+        for fst_ver, ilg_ver in ilg_helpers.REPLACEMENTS.items():
+            new_gloss = new_gloss.replace(fst_ver, ilg_ver)
+        new_gloss = re.sub(r"(\w+)\+OBL", r"OBL-\1.II", new_gloss)
+        new_gloss = re.sub(r"(\w+)\+DEM", r"DEM.\1", new_gloss)
+        if '+QUOT' in new_gloss:
+            new_gloss = re.sub(r"(\d)SG\+QUOT", r"\1.I=QUOT", new_gloss)
+            new_gloss = re.sub(r"3PL\+QUOT", r"3.I=QUOT.3PL", new_gloss)
+            new_gloss = re.sub(r"(\d)PL\+QUOT", r"\1.I=QUOT.PL", new_gloss)
+        return re.sub(STEM_PAT, '___', new_gloss)
+
+    def random_glosses(self, separators, count=5000):
+        morphemes = list(ilg_helpers.REPLACEMENTS) + [
+            "g$at+VI", "w$an+N", "hind$a+ADV", "3.II", "[-3.II]", "=CN", "=PN",
+            "1SG+OBL", "3+OBL", "PROX+DEM", "2SG+QUOT", "3PL+QUOT", "1PL+QUOT",
+            "3.III+PRO", "FOC+OP", "@P.SI.1@", "1SG", "+", "PRO", "x", "'", "$",
+        ]
+        rng = random.Random(0)
+        for _ in range(count):
+            parts = rng.choices(morphemes, k=rng.randint(1, 6))
+            yield "".join(rng.choice(separators) + part for part in parts)
+
+    def test_sameAsStepwise(self):
+        for fst_ver in self.random_glosses("-=~"):
+            self.assertEqual(self.convert(fst_ver), self.stepwise(fst_ver), fst_ver)
+
+    def test_sameAsStepwiseRunTogether(self):
+        for fst_ver in self.random_glosses(["", "", "-", "=", ".", "+"]):
+            self.assertEqual(self.convert(fst_ver), self.stepwise(fst_ver), fst_ver)
+
+
 class TestAnalysisMatching(unittest.TestCase):
     
     def test_scoreSimpleMatch(self):
@@ -144,3 +188,33 @@ class TestAnalysisMatching(unittest.TestCase):
         self.assertEqual(
             res, [("'$am+VI[-3.II]=CN", 0.628), ("'$am+VI=CN", 0.546)])
     # add tests to do with option sort?
+
+class TestValidateGlosses(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [
+            (['n$ee+AUX', 'n$ee+VI'], 'NEG'),
+            (["'$am+VI[-3.II]=CN", "'$am+VI=CN"], 'good[-3.II]=CN'),
+            (['n$ee+AUX-3.II'], 'PROG'),
+            ([], 'NEG'),
+            (['n$ee+AUX', 'n$ee+VI'], 'NEG'),
+        ]
+
+    def test_validateSameAsFilter(self):
+        expected = [ilg_helpers.filter_matching_glosses(*item) for item in self.items]
+        self.assertEqual(ilg_helpers.validate_glosses(self.items), expected)
+
+    def test_validateWorkers(self):
+        expected = ilg_helpers.validate_glosses(self.items)
+        result = ilg_helpers.validate_glosses(self.items, workers=2, chunk_size=2)
+        self.assertEqual(result, expected)
+
+    def test_validateNoWorkers(self):
+        expected = ilg_helpers.validate_glosses(self.items)
+        for workers in (0, -1):
+            result = ilg_helpers.validate_glosses(self.items, workers=workers)
+            self.assertEqual(result, expected)
+
+    def test_validateEmpty(self):
+        self.assertEqual(ilg_helpers.validate_glosses([]), [])
+
@@ -0,0 +1,106 @@
+import unittest
+import os, shutil
+
+from test import FIX_DIR
+from src.__main__ import format_result, load_config, lookup_lines, main, schedule
+from src.builder import FomaBuilder
+from src.parser import BASIC_E
+
+"""
+This suite tests the command line entry point. The build tests run
+without foma: config loading and the scheduling of parallel builds.
+The lookup tests use the test.foma fixture.
+"""
+
+
+class TestBuildCommand(unittest.TestCase):
+
+    def make_config(self, name, rules="test_rules.txt"):
+        return {
+            "test": True,
+            "name": name,
+            "lexc_files": ["test_nouns.txt"],
+            "rules_files": [rules],
+            "dictionary": {'Noun': ["test"]},
+            "legal_categories": ["noun"]
+        }
+
+    def test_load_config(self):
+        config = load_config(BASIC_E)
+        self.assertEqual(config['name'], 'git_basic_E')
+        self.assertNotIn('output_dir', config)
+
+    def test_load_config_output_dir(self):
+        config = load_config(BASIC_E, '/tmp/builds')
+        self.assertEqual(config['output_dir'], '/tmp/builds/git_basic_E')
+        self.assertEqual(config['definitions_dir'], '/tmp/builds')
+
+    def test_schedule_shared_cache(self):
+        configs = [self.make_config(name) for name in ('a', 'b', 'c')]
+        first, rest = schedule(configs)
+        self.assertEqual([c['name'] for c in first], ['a'])
+        self.assertEqual([c['name'] for c in rest], ['b', 'c'])
+
+    def test_schedule_cached(self):
+        path = os.path.join(FIX_DIR, 'foma')
+        configs = [self.make_config(name) for name in ('a', 'b')]
+        try:
+            os.mkdir(path)
+            open(FomaBuilder(configs[0]).definitions_filepath(), 'w').close()
+            first, rest = schedule(configs)
+            self.assertEqual(len(first), 2)
+            self.assertEqual(rest, [])
+        finally:
+            shutil.rmtree(path)
+
+    def test_schedule_isolated(self):
+        configs = [self.make_config(name) for name in ('a', 'b')]
+        for config in configs:
+            config['output_dir'] = 'foma/' + config['name']
+        first, rest = schedule(configs)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(rest, [])
+
+    def test_schedule_shared_definitions_dir(self):
+        configs = [self.make_config(name) for name in ('a', 'b')]
+        for config in configs:
+            config['output_dir'] = 'builds/' + config['name']
+            config['definitions_dir'] = 'builds'
+        first, rest = schedule(configs)
+        self.assertEqual([c['name'] for c in first], ['a'])
+        self.assertEqual([c['name'] for c in rest], ['b'])
+
+    def test_no_configs(self):
+        self.assertEqual(main(['build']), 2)
+
+
+class TestLookupCommand(unittest.TestCase):
+
+    def setUp(self):
+        self.foma_file = FIX_DIR + '/test.foma'
+
+    def test_lookup_lines(self):
+        lines = ['dog\n', 'xxx\n', 'dog\n']
+        result = list(lookup_lines(lines, 'analyze', self.foma_file, batch_size=2))
+        self.assertEqual(result, [('dog', ['cog']), ('xxx', []), ('dog', ['cog'])])
+
+    def test_lookup_lines_workers(self):
+        lines = ['cog\n'] * 5 + ['xxx\n']
+        result = list(lookup_lines(
+            lines, 'generate', self.foma_file, batch_size=2, workers=2))
+        self.assertEqual([query for query, _ in result], ['cog'] * 5 + ['xxx'])
+        self.assertEqual(result[0][1], ['dog'])
+        self.assertEqual(result[-1][1], [])
+
+    def test_format_jsonl(self):
+        line = format_result('gat', ['g$at+N'], 'jsonl')
+        self.assertEqual(line, '{"input": "gat", "results": ["g$at+N"]}')
+
+    def test_format_tsv(self):
+        line = format_result('gat', ['g$at+N', 'g$at+VI'], 'tsv')
+        self.assertEqual(line, 'gat\tg$at+N\tg$at+VI')
+
+    def test_format_tsv_lemmas(self):
+        line = format_result('x', [[('a', 'N'), ('b', 'VI')]], 'tsv')
+        self.assertEqual(line, 'x\ta:N b:VI')
+
@@ -1,8 +1,14 @@
 import unittest
+import os
 from src.parser import Parser, ParserError
+from src.builder import BuilderError
 from src.ilg_helpers import STEM_PAT
 import unittest
-from test import TestFSTOutput, BASIC_E, BASIC_EW, FULL_E
+from test import TestFSTOutput, FIX_DIR, BASIC_E, BASIC_EW, FULL_E
+from test import create_fst_config, import_fst_files
+from src import helpers
+from src.analysis import parse_analysis
+from src.foma_reader import FomaReader
 
 """
 This suite builds a parser object end-to-end from input files 
@@ -62,6 +68,53 @@ class TestParser(TestFSTOutput):
         self.assertEqual(len(lookup_result), 0)
         # but note morphemes in validator string need not be matched
 
+    # tests for batch analyze function
+    def test_analyzeMany(self):
+        lookup_result = self.fst.analyze_many(["gwila", "xxx", "g̱an", "gwila"])
+        self.assertEqual(len(lookup_result), 4)
+        self.assertIn("gwil$a+N", lookup_result[0])
+        self.assertEqual(lookup_result[1], [])
+        self.assertIn("g_$an+N", lookup_result[2])
+        self.assertEqual(lookup_result[0], lookup_result[3])
+
+    def test_analyzeManyMatchesAnalyze(self):
+        words = ["gwilan", "want", "simiwani'm"]
+        expected = [self.fst.analyze(word) for word in words]
+        self.assertEqual(self.fst.analyze_many(words), expected)
+
+    def test_analyzeManyEmpty(self):
+        self.assertEqual(self.fst.analyze_many([]), [])
+
+    def test_analyzeStructured(self):
+        lookup_result = self.fst.analyze("gwilan", structured=True)
+        self.assertEqual(lookup_result, self.fst.analyze("gwilan"))
+        self.assertEqual(lookup_result[0].stems, ("gwil$a+N",))
+        self.assertIs(self.fst.analyze("gwilan", structured=True)[0], lookup_result[0])
+        self.assertIs(type(self.fst.analyze("gwilan")[0]), str)
+        lookup_result = self.fst.analyze_many(["gwila", "xxx"], structured=True)
+        self.assertEqual(lookup_result[0][0].pos, ("N",))
+        self.assertEqual(lookup_result[1], [])
+
+    # tests for text analysis functions
+    def test_analyzeText(self):
+        result = self.fst.analyze_text("Gwila, g̱an gwila.")
+        self.assertEqual([item["token"] for item in result], ["Gwila", "g̱an", "gwila"])
+        self.assertEqual((result[1]["start"], result[1]["end"]), (7, 11))
+        self.assertIn("gwil$a+N", result[0]["analyses"])
+        self.assertIn("g_$an+N", result[1]["analyses"])
+        self.assertEqual(result[0]["analyses"], result[2]["analyses"])
+
+    def test_analyzeTextEmpty(self):
+        self.assertEqual(self.fst.analyze_text(" ... "), [])
+
+    def test_iterAnalyzeLines(self):
+        lines = ["gwila xxx\n", "\n", "wan\n"]
+        result = list(self.fst.iter_analyze_lines(lines, batch_size=1))
+        self.assertEqual(len(result), 3)
+        self.assertEqual(result[0][1]["analyses"], [])
+        self.assertEqual(result[1], [])
+        self.assertEqual(result[2][0]["analyses"], self.fst.analyze("wan"))
+
     # tests for generate function
     def test_generateSuccess(self):
         lookup_result = self.fst.generate("gwil$a+N")
@@ -82,6 +135,60 @@ class TestParser(TestFSTOutput):
         lookup_result = self.fst.generate("g_$an+N")
         self.assertIn("g̱an", lookup_result)
 
+    # tests for batch generate function
+    def test_generateMany(self):
+        lookup_result = self.fst.generate_many(["gwil$a+N", "xxx", "g_$an+N"])
+        self.assertEqual(len(lookup_result), 3)
+        self.assertIn("gwila", lookup_result[0])
+        self.assertEqual(lookup_result[1], [])
+        self.assertIn("g̱an", lookup_result[2])
+
+    # tests for result caches
+    def test_cacheStats(self):
+        self.fst.analyze("gwila")
+        before = self.fst.cache_stats()["analyze"]
+        self.fst.analyze("gwila")
+        after = self.fst.cache_stats()["analyze"]
+        self.assertEqual(after["hits"], before["hits"] + 1)
+        self.assertEqual(after["misses"], before["misses"])
+        self.assertIn("generate", self.fst.cache_stats())
+
+    def test_cacheBounded(self):
+        fst = Parser(self.config, cache_size=2)
+        fst.analyze_many(["gwila", "g̱an", "wan"])
+        stats = fst.cache_stats()["analyze"]
+        self.assertEqual(stats["size"], 2)
+        self.assertEqual(stats["evictions"], 1)
+
+    def test_negativeCache(self):
+        fst = Parser(self.config, cache_size=1)
+        self.assertEqual(fst.analyze("xxx"), [])
+        self.assertEqual(fst.analyze_many(["xxx", "gwila"])[0], [])
+        stats = fst.cache_stats()
+        self.assertEqual(stats["unanalyzed"]["size"], 1)
+        self.assertEqual(stats["unanalyzed"]["hits"], 1)
+        self.assertNotIn("xxx", fst.analyzer_dict)
+
+    def test_lazyLoad(self):
+        fst = Parser(self.config, lazy=True)
+        self.assertFalse(fst.loaded)
+        self.assertIn("gwil$a+N", fst.analyze("gwila"))
+        self.assertTrue(fst.loaded)
+
+    def test_lazyWarm(self):
+        fst = Parser(self.config, lazy=True)
+        fst.warm()
+        self.assertTrue(fst.loaded)
+
+    def test_persistentCache(self):
+        path = os.path.join(FIX_DIR, 'foma', 'cache.sqlite')
+        fst = Parser(self.config, persistent_cache=path)
+        expected = fst.analyze("gwila")
+
+        fst = Parser(self.config, persistent_cache=path)
+        self.assertEqual(fst.analyze("gwila"), expected)
+        self.assertEqual(fst.cache_stats()["analyze"]["disk_hits"], 1)
+
     # test pairs, random pairs, unique pairs list functions
     def test_pairsIsList(self):
         result = self.fst.pairs()
@@ -111,6 +218,42 @@ class TestParser(TestFSTOutput):
         with self.assertRaises(ParserError):
             self.fst.random_unique_pairs(1000)
 
+    def test_iterPairs(self):
+        result = list(self.fst.iter_pairs())
+        self.assertGreater(len(result), 100)
+        self.assertIn(("gwil$a+N", "gwila"), result)
+
+    def test_iterPairsLimitFilter(self):
+        result = list(self.fst.iter_pairs(limit=5, upper_filter="+VI"))
+        self.assertEqual(len(result), 5)
+        self.assertTrue(all("+VI" in analysis for analysis, _ in result))
+
+    def test_writePairs(self):
+        path = os.path.join(FIX_DIR, "pairs.tsv")
+        try:
+            count = self.fst.write_pairs(path, limit=10, chunk_size=3)
+            with open(path) as f:
+                lines = f.read().splitlines()
+        finally:
+            os.remove(path)
+        self.assertEqual(count, 10)
+        self.assertEqual(lines[0].split("\t"), list(next(self.fst.iter_pairs())))
+
+    def test_randomUniquePairsTag(self):
+        result = self.fst.random_unique_pairs(3, tag="+VI")
+        self.assertEqual(len(set(result)), 3)
+        self.assertTrue(all("+VI" in analysis for analysis, _ in result))
+
+    def test_randomUniquePairsSeed(self):
+        result = self.fst.random_unique_pairs(10, seed=1)
+        self.assertEqual(self.fst.random_unique_pairs(10, seed=1), result)
+
+    def test_randomPairsByTag(self):
+        result = self.fst.random_pairs_by_tag(5, ["+N", "+VI"])
+        self.assertEqual(set(result), {"+N", "+VI"})
+        self.assertEqual(len(result["+N"]), 5)
+        self.assertTrue(all("+N" in analysis for analysis, _ in result["+N"]))
+
     #  test lemmatize function for various input
     def test_lemmatizeEqual(self):
         result = self.fst.lemmatize("gwila")
@@ -148,6 +291,22 @@ class TestParser(TestFSTOutput):
         expected = [[("sim", "MDF"), ("wan", "N")], [("sim", "MDF"), ("wan", "VI")]]
         self.assertEqual(result, sorted(expected))
 
+    def test_lemmatizeFromTable(self):
+        # the stems are in the table, so nothing is generated
+        generated = self.fst.cache_stats()["generate"]["misses"]
+        self.assertEqual(self.fst._stem_forms(["gwil$a+N"]), {"gwil$a+N": ["gwila"]})
+        self.assertEqual(self.fst._state.lemmas["gwil$a+N"], ["gwila"])
+        result = self.fst._lemmatize_many(["'niiwani'm"])[0]
+        self.assertEqual(result, [[("'nii", "PVB"), ("wan", "VI")]])
+        self.assertEqual(self.fst.cache_stats()["generate"]["misses"], generated)
+
+    def test_lemmatizeMany(self):
+        words = ["'niiwani'm", "xxx", "simiwani'm", "'niiwani'm"]
+        expected = [self.fst.lemmatize(word) for word in words]
+        self.fst.lemmatizer_dict.clear()
+        self.assertEqual(self.fst.lemmatize_many(words), expected)
+        self.assertEqual(self.fst.lemmatize_many([]), [])
+
     # test make lemma tuple function
     def test_lemmaTuple(self):
         result = self.fst._analysis_to_lemma_tuple("w$an+N")
@@ -166,6 +325,25 @@ class TestParser(TestFSTOutput):
         # no final validation because no validators input
         self.assertEqual(result.get("validated"), None)
 
+    def test_validateCorpus(self):
+        pairs = [("gwila", "___"), ("wan", "___"), ("xxx", "NEG"), ("gwila", "___")]
+        result = self.fst.validate_corpus(pairs)
+        self.assertEqual(len(result), 4)
+        expected = self.fst.analyze_properties("wan", "___")["valid_gloss_scored"]
+        self.assertEqual(result[1], expected)
+        self.assertEqual(result[2], [])
+        self.assertEqual(result[0], result[3])
+
+    def test_analyzeProperties_unknownSymbols(self):
+        result = self.fst.analyze_properties("gwila7q")
+        self.assertEqual(result.get("output"), [])
+        self.assertEqual(result.get("unknown_symbols"), ["7", "q"])
+
+    def test_unknownSymbols(self):
+        self.assertEqual(self.fst.unknown_symbols("gwila7q"), ["7", "q"])
+        self.assertEqual(self.fst.unknown_symbols("gwil$a+N", inverse=True), [])
+        self.assertEqual(self.fst.unknown_symbols("gwil$a+N%", inverse=True), ["%"])
+
     def test_analyzeProperties_validateGlossExact(self):
         query = "gwila"
         result = self.fst.analyze_properties(query, gloss_validator="blanket")
@@ -253,6 +431,69 @@ class TestParserVariant(TestFSTOutput):
         self.assertEqual(result, expected)
 
 
+class TestParserLemmatizer(TestFSTOutput):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = create_fst_config(FULL_E, {
+            "Modal": ["dim"],
+            "Noun": ["w$an"],
+            "IntransitiveVerb": ["w$an"],
+            "Preverb": ["'nii"],
+        })
+        cls.config["lemmatizer"] = True
+        cls.added_files = import_fst_files(cls.config)
+        cls.fst = Parser(cls.config)
+
+    def test_lemmatizerLoaded(self):
+        self.assertIsInstance(self.fst._state.lemmatizer, FomaReader)
+
+    def test_lemmatizeUnknown(self):
+        self.assertEqual(self.fst._stem_options("xxx"), [])
+
+    def test_lemmatizeManyWithoutAnalyzing(self):
+        analyzed = self.fst.cache_stats()["analyze"]["misses"]
+        words = ["want", "'niiwani'm", "dim", "mi"]
+        expected = [
+            [[("wan", "N")], [("wan", "VI")]],
+            [[("'nii", "PVB"), ("wan", "VI")]],
+            [[("dim", "MOD")]],
+            None,
+        ]
+        self.assertEqual(self.fst.lemmatize_many(words), expected)
+        self.assertEqual(self.fst.cache_stats()["analyze"]["misses"], analyzed)
+
+    def test_lemmatizeNoStems(self):
+        # "mi" analyzes to an affix alone, so it has no lemma
+        self.assertEqual(self.fst._stem_options("mi"), [()])
+        self.assertIsNone(self.fst.lemmatize("mi"))
+        self.assertNotIn("mi", self.fst.negative_cache)
+        self.assertIn("2.I", self.fst.analyze("mi"))
+
+    def test_lemmatizeNoAnalysis(self):
+        analyzed = self.fst.cache_stats()["analyze"]["misses"]
+        result = self.fst.lemmatize("want")
+        self.assertEqual(result, [[("wan", "N")], [("wan", "VI")]])
+        self.assertEqual(self.fst.cache_stats()["analyze"]["misses"], analyzed)
+
+    def test_lemmatizeCompound(self):
+        result = self.fst.lemmatize("'niiwani'm")
+        self.assertEqual(result, [[("'nii", "PVB"), ("wan", "VI")]])
+
+    def test_lemmatizeFunctional(self):
+        self.assertEqual(self.fst.lemmatize("dim"), [[("dim", "MOD")]])
+        self.assertEqual(self.fst.lemmatize("dii"), [[("dii", "OP")]])
+        self.assertEqual(self.fst.lemmatize("tun"), [[("-un", "DEM")]])
+
+    def test_lemmatizeMatchesAnalyses(self):
+        for word in ["want", "'niiwani'm", "asun", "mi", "xxx"]:
+            expected = helpers.unique(
+                [parse_analysis(a).stems for a in self.fst.analyze(word)]
+            )
+            actual = helpers.unique(self.fst._stem_options(word))
+            self.assertEqual(sorted(actual), sorted(expected))
+
+
 class TestParserFunctional(TestFSTOutput):
 
     @classmethod
@@ -298,6 +539,70 @@ class TestParserFunctional(TestFSTOutput):
         self.assertEqual(result, expected)
 
 
+class TestLazyParser(unittest.TestCase):
+    """
+    Lazy parsers check their input without building anything.
+    """
+
+    def test_lazyInvalidConfig(self):
+        with self.assertRaises(BuilderError):
+            Parser({"lexc_files": [], "rules_files": []}, lazy=True)
+
+    def test_lazyMissingFoma(self):
+        with self.assertRaises(FileNotFoundError):
+            Parser("lalala.foma", lazy=True)
+
+    def test_lazyUnknownInput(self):
+        with self.assertRaises(ParserError):
+            Parser("lalala.txt", lazy=True)
+
+    def test_lazyNotLoaded(self):
+        fst = Parser(FIX_DIR + "/test.foma", lazy=True)
+        self.assertFalse(fst.loaded)
+        self.assertEqual(fst.cache_stats()["analyze"]["size"], 0)
+
+
+class TestSharedParser(unittest.TestCase):
+    """
+    Shared parsers for the same input and settings use one FST and
+    one set of caches, released along with the last parser.
+    """
+
+    def setUp(self):
+        self.foma_file = FIX_DIR + "/test.foma"
+
+    def test_sharedState(self):
+        fst = Parser(self.foma_file, lazy=True, shared=True)
+        other = Parser(self.foma_file, lazy=True, shared=True)
+        self.assertIs(fst._state, other._state)
+        self.assertIs(fst.analyzer_dict, other.analyzer_dict)
+        fst.analyzer_dict["dog"] = ["cog"]
+        self.assertEqual(other.cache_stats(), fst.cache_stats())
+        fst.close()
+        other.close()
+
+    def test_sharedSettings(self):
+        fst = Parser(self.foma_file, lazy=True, shared=True)
+        bounded = Parser(self.foma_file, lazy=True, shared=True, cache_size=10)
+        unshared = Parser(self.foma_file, lazy=True)
+        self.assertIsNot(fst._state, bounded._state)
+        self.assertIsNot(fst._state, unshared._state)
+        fst.close()
+        bounded.close()
+
+    def test_sharedRelease(self):
+        fst = Parser(self.foma_file, lazy=True, shared=True)
+        other = Parser(self.foma_file, lazy=True, shared=True)
+        state = fst._state
+        self.assertEqual(state.refs, 2)
+        fst.close()
+        fst.close()  # closing twice releases once
+        self.assertEqual(state.refs, 1)
+        del other
+        self.assertEqual(state.refs, 0)
+        self.assertIsNot(Parser(self.foma_file, lazy=True, shared=True)._state, state)
+
+
 # python -m unittest test
 # python -m unittest discover # all test files in current dir
 # python -m unittest discover -s tests # all test files in /tests
@@ -1,7 +1,12 @@
 import unittest
 
 from test import FIX_DIR
-from src.foma_reader import FomaError, FomaReader
+from src.foma_reader import FomaError, FomaReader, LibfomaLookup
+
+try:
+    from src import foma
+except ImportError:
+    foma = None
 
 """
 This suite tests the behavior of the interface class that loads foma
@@ -30,6 +35,17 @@ class TestBuilder(unittest.TestCase):
         self.assertEqual(self.reader.query('upper-words'), 'cog')
         self.assertEqual(self.reader.query('lower-words'), 'dog')
 
+    def test_query_reuses_session(self):
+        self.reader.query('upper-words')
+        process = self.reader._session._process
+        self.assertEqual(self.reader.query('lower-words'), 'dog')
+        self.assertIs(self.reader._session._process, process)
+
+    def test_query_restarts_session(self):
+        self.reader.query('upper-words')
+        self.reader._session.close()
+        self.assertEqual(self.reader.query('upper-words'), 'cog')
+
     def test_lookup(self):
         result = self.reader.lookup('dog')
         self.assertEqual(result, ['cog'])
@@ -46,4 +62,86 @@ class TestBuilder(unittest.TestCase):
     def test_inverse_lookup_no_bin(self):
         reader = FomaReader(self.path)
         result = reader.lookup('cog', inverse=True)
-        self.assertEqual(result, ['dog'])
\ No newline at end of file
+        self.assertEqual(result, ['dog'])
+
+    def test_lookup_reuses_flookup(self):
+        self.reader.lookup('dog')
+        process = self.reader._flookups[False]._process
+        self.assertEqual(self.reader.lookup('dog'), ['cog'])
+        self.assertIs(self.reader._flookups[False]._process, process)
+
+    def test_lookup_restarts_flookup(self):
+        self.reader.lookup('dog')
+        process = self.reader._flookups[False]._process
+        process.kill()
+        process.wait()
+        self.assertEqual(self.reader.lookup('dog'), ['cog'])
+        self.assertIsNot(self.reader._flookups[False]._process, process)
+
+    def test_lookup_failure(self):
+        self.assertEqual(self.reader.lookup('xxx'), [])
+        self.assertEqual(self.reader.lookup('dog'), ['cog'])
+
+    def test_lookup_many(self):
+        result = self.reader.lookup_many(['dog', 'xxx', 'dog'])
+        self.assertEqual(result, [['cog'], [], ['cog']])
+
+    def test_inverse_lookup_many(self):
+        result = self.reader.lookup_many(['cog', 'xxx'], inverse=True)
+        self.assertEqual(result, [['dog'], []])
+
+    def test_lookup_many_no_bin(self):
+        reader = FomaReader(self.path)
+        result = reader.lookup_many(['dog', 'xxx'])
+        self.assertEqual(result, [['cog'], []])
+
+    def test_unknown_symbols(self):
+        self.assertEqual(self.reader.unknown_symbols('dog'), set())
+        self.assertEqual(self.reader.unknown_symbols('dog1'), {'1'})
+        self.assertEqual(self.reader.unknown_symbols('dog', inverse=True), set())
+
+    def test_unknown_symbols_no_lookup(self):
+        reader = FomaReader(self.path, self.binpath)
+        self.assertEqual(reader.lookup('dog1'), [])
+        self.assertEqual(reader.lookup_many(['dog1', 'q']), [[], []])
+        self.assertEqual(reader._flookups, {})
+
+    def test_unknown_symbols_no_bin(self):
+        reader = FomaReader(self.path)
+        self.assertEqual(reader.unknown_symbols('dog1'), set())
+
+    def test_unknown_backend(self):
+        with self.assertRaises(FomaError):
+            FomaReader(self.path, self.binpath, backend='lalala')
+
+
+@unittest.skipIf(foma is None, "libfoma not available")
+class TestLibfomaBackend(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path = FIX_DIR + '/test.foma'
+        cls.binpath = FIX_DIR + '/test.fomabin'
+        cls.reader = FomaReader(cls.path, cls.binpath, backend='libfoma')
+
+    def test_lookup(self):
+        self.assertEqual(self.reader.lookup('dog'), ['cog'])
+        self.assertEqual(self.reader.lookup('xxx'), [])
+
+    def test_inverse_lookup(self):
+        self.assertEqual(self.reader.lookup('cog', inverse=True), ['dog'])
+
+    def test_lookup_many(self):
+        result = self.reader.lookup_many(['dog', 'xxx', 'dog'])
+        self.assertEqual(result, [['cog'], [], ['cog']])
+
+    def test_shares_machine(self):
+        up = self.reader._lookup_backend(False)
+        down = self.reader._lookup_backend(True)
+        self.assertIs(up._fst, down._fst)
+
+    def test_bad_binary(self):
+        with self.assertRaises(FomaError):
+            LibfomaLookup(self.path)
+        with self.assertRaises(FomaError):
+            LibfomaLookup(FIX_DIR + '/missing.fomabin')
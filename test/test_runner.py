@@ -0,0 +1,41 @@
+import unittest
+
+from test import FIX_DIR
+from src.parser import Parser
+from src.runner import run_chunk, run_corpus, run_task
+
+"""
+This suite tests the parallel corpus runner with the test.foma
+fixture, which analyzes 'dog' as 'cog'.
+"""
+
+
+class TestRunner(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.foma_file = FIX_DIR + '/test.foma'
+        cls.fst = Parser(cls.foma_file)
+
+    def test_run_task(self):
+        result = run_task(self.fst, 'analyze', ['dog', 'xxx'])
+        self.assertEqual(result, [['cog'], []])
+
+    def test_run_task_unknown(self):
+        with self.assertRaises(ValueError):
+            run_task(self.fst, 'lalala', ['dog'])
+
+    def test_run_chunk(self):
+        result = run_chunk(self.fst, ('analyze', 'generate'), ['dog'])
+        self.assertEqual(result, [{'input': 'dog', 'analyze': ['cog'], 'generate': []}])
+
+    def test_run_corpus_order(self):
+        lines = ['dog\n', 'xxx\n'] * 5
+        rows = list(run_corpus(
+            lines, self.foma_file, ('analyze',), chunk_size=3, workers=2))
+        self.assertEqual([row['input'] for row in rows], ['dog', 'xxx'] * 5)
+        self.assertEqual([row['analyze'] for row in rows], [['cog'], []] * 5)
+
+    def test_run_corpus_one_worker(self):
+        rows = list(run_corpus(['dog'], self.foma_file, ('analyze',), workers=1))
+        self.assertEqual(rows, [{'input': 'dog', 'analyze': ['cog']}])